@@ -0,0 +1,113 @@
+"""
+Micro-benchmark: news image extraction, BeautifulSoup vs news_extract.
+
+Runs over the stored fixtures in benchmarks/fixtures:
+  * feed bodies (Google News, NYT, a blog with content:encoded) through the
+    old per-entry BeautifulSoup parse and through `first_img_src`;
+  * an article page through the old full-page og:image soup and through
+    `read_head` + `meta_image`, including bytes read from the "network".
+
+    PYTHONPATH=. python benchmarks/news_extract_bench.py [--rounds N]
+"""
+import argparse
+import asyncio
+import time
+from pathlib import Path
+
+import feedparser
+import httpx
+from bs4 import BeautifulSoup
+
+from studio.services.news_extract import first_img_src, meta_image, read_head
+
+FIXTURES = Path(__file__).parent / "fixtures"
+FEEDS = ("google_news.xml", "nyt_home.xml", "blog_content.xml")
+ARTICLE = "article_page.html"
+
+
+# ---------- Previous implementation ----------
+def soup_img_src(html_blob: str):
+    if html_blob:
+        img_tag = BeautifulSoup(html_blob, "html.parser").find("img")
+        if img_tag and img_tag.get("src"):
+            return img_tag["src"]
+    return None
+
+
+def soup_og_image(html: str):
+    soup = BeautifulSoup(html, "html.parser")
+    for attrs in ({"property": "og:image"}, {"name": "twitter:image"}):
+        tag = soup.find("meta", attrs=attrs)
+        if tag and tag.get("content"):
+            return tag["content"]
+    return None
+
+
+# ---------- Helpers ----------
+def _bodies(entry) -> str:
+    if "content" in entry and entry.content:
+        return " ".join([c.get("value", "") for c in entry.content])
+    return entry.get("summary", "") or ""
+
+
+def _time(fn, inputs, rounds: int) -> float:
+    """Best-of-`rounds` milliseconds for one pass of `fn` over `inputs`."""
+    best = float("inf")
+    for _ in range(rounds):
+        started = time.perf_counter()
+        for value in inputs:
+            fn(value)
+        best = min(best, time.perf_counter() - started)
+    return best * 1000
+
+
+def _row(label: str, old_ms: float, new_ms: float):
+    print(f"{label:<28} {old_ms:>10.2f} {new_ms:>10.2f} {old_ms / max(new_ms, 1e-9):>8.1f}x")
+
+
+async def _read_article_head(page: bytes, chunk_size: int = 4096):
+    """(head html, bytes pulled from the response) for `page` served in chunks."""
+    sent = 0
+
+    async def body():
+        nonlocal sent
+        for i in range(0, len(page), chunk_size):
+            sent += len(page[i:i + chunk_size])
+            yield page[i:i + chunk_size]
+
+    def handler(request):
+        return httpx.Response(200, headers={"content-type": "text/html; charset=utf-8"}, content=body())
+
+    async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+        async with client.stream("GET", "https://example.com/article") as resp:
+            head = await read_head(resp)
+    return head, sent
+
+
+# ---------- Main ----------
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'fixture':<28} {'soup ms':>10} {'new ms':>10} {'speedup':>9}")
+    for name in FEEDS:
+        entries = feedparser.parse((FIXTURES / name).read_bytes()).entries
+        blobs = [_bodies(e) for e in entries]
+        mismatches = sum(soup_img_src(b) != first_img_src(b) for b in blobs)
+        _row(f"{name} ({len(blobs)} items)", _time(soup_img_src, blobs, args.rounds),
+             _time(first_img_src, blobs, args.rounds))
+        if mismatches:
+            print(f"  !! {mismatches} entries disagree with the soup result")
+
+    page = (FIXTURES / ARTICLE).read_bytes()
+    head, received = asyncio.run(_read_article_head(page))
+    full_html = page.decode("utf-8")
+    assert soup_og_image(full_html) == meta_image(head), "og:image mismatch"
+    _row(f"{ARTICLE} og:image", _time(soup_og_image, [full_html], args.rounds),
+         _time(meta_image, [head], args.rounds))
+    print(f"{'':<28} bytes read: {len(page)} full page vs {received} head-only")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""
+Throughput benchmark: RAG ingestion, one-shot LangChain path vs the pipeline.
+
+Builds a synthetic corpus (.txt / .md / .docx) in a temporary directory and
+ingests it three ways, reporting docs/sec and chunks/sec:
+  * baseline: sequential loaders + split_documents + Chroma.from_documents
+    (what ingest() used to do);
+  * pipeline: tools.RAG.ingestor.ingest(full=True);
+  * incremental: ingest() again after editing one file.
+
+    PYTHONPATH=. python benchmarks/rag_ingest_bench.py [--docs 200] [--workers N] [--batch 256]
+"""
+import argparse
+import os
+import random
+import shutil
+import tempfile
+import time
+
+WORDS = ("retrieval embedding vector chunk corpus latency batch index query document "
+         "pipeline throughput model token context manifest store parse worker core").split()
+
+
+def _paragraph(rng: random.Random) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(rng.randint(60, 140))) + "."
+
+
+def build_corpus(directory: str, docs: int, paragraphs: int, seed: int = 7):
+    from docx import Document
+
+    rng = random.Random(seed)
+    for i in range(docs):
+        body = [_paragraph(rng) for _ in range(paragraphs)]
+        kind = i % 3
+        if kind == 0:
+            with open(os.path.join(directory, f"doc{i:04d}.txt"), "w", encoding="utf-8") as f:
+                f.write("\n\n".join(body))
+        elif kind == 1:
+            with open(os.path.join(directory, f"doc{i:04d}.md"), "w", encoding="utf-8") as f:
+                f.write(f"# Document {i}\n\n" + "\n\n".join(f"## Section {n}\n\n{p}" for n, p in enumerate(body)))
+        else:
+            document = Document()
+            document.add_heading(f"Document {i}", level=1)
+            for p in body:
+                document.add_paragraph(p)
+            document.save(os.path.join(directory, f"doc{i:04d}.docx"))
+
+
+def _line(label: str, docs: int, chunks: int, seconds: float):
+    print(f"{label:<14} {docs:>6} docs {chunks:>8} chunks {seconds:>8.2f}s "
+          f"{docs / seconds:>9.1f} docs/s {chunks / seconds:>10.1f} chunks/s")
+
+
+def run_baseline(ingestor, corpus: str, db_dir: str):
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+    from langchain.vectorstores import Chroma
+    from langchain_community.document_loaders import (
+        Docx2txtLoader, PDFPlumberLoader, TextLoader, UnstructuredMarkdownLoader,
+    )
+
+    loaders = {".txt": TextLoader, ".md": UnstructuredMarkdownLoader, ".pdf": PDFPlumberLoader, ".docx": Docx2txtLoader}
+    started = time.perf_counter()
+    raw_docs = []
+    fnames = sorted(os.listdir(corpus))
+    for fname in fnames:
+        raw_docs.extend(loaders[os.path.splitext(fname)[1]](os.path.join(corpus, fname)).load())
+    chunks = RecursiveCharacterTextSplitter(chunk_size=ingestor.CHUNK_SIZE, chunk_overlap=ingestor.CHUNK_OVERLAP) \
+        .split_documents(raw_docs)
+    Chroma.from_documents(chunks, embedding=ingestor.get_embedding_model(), persist_directory=db_dir)
+    _line("baseline", len(fnames), len(chunks), time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--docs", type=int, default=200)
+    parser.add_argument("--paragraphs", type=int, default=20, help="paragraphs per document")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="parse processes")
+    parser.add_argument("--batch", type=int, default=256, help="chunks per embed + write")
+    parser.add_argument("--skip-baseline", action="store_true")
+    args = parser.parse_args()
+
+    # The ingestor reads its knobs at import time.
+    os.environ["RAG_PARSE_WORKERS"] = str(args.workers)
+    os.environ["RAG_BATCH_SIZE"] = str(args.batch)
+    from tools.RAG import ingestor
+
+    workdir = tempfile.mkdtemp(prefix="rag-bench-")
+    try:
+        corpus = os.path.join(workdir, "documents")
+        os.makedirs(corpus)
+        build_corpus(corpus, args.docs, args.paragraphs)
+        ingestor.INGEST_DIR = corpus
+        ingestor.CHROMA_DB_DIR = os.path.join(workdir, "chroma_db")
+        ingestor.MANIFEST_PATH = os.path.join(ingestor.CHROMA_DB_DIR, "manifest.json")
+        ingestor.get_embedding_model().embed_documents(["warm up"])   # model load is not ingestion
+
+        print(f"corpus: {args.docs} docs in {corpus}; workers={args.workers} batch={args.batch}")
+        if not args.skip_baseline:
+            run_baseline(ingestor, corpus, os.path.join(workdir, "baseline_db"))
+
+        report = ingestor.ingest(full=True)
+        timing = report["timing"]
+        _line("pipeline", len(report["added"]), report["chunks_added"], timing["total_s"])
+        print(f"{'':<14} embed {timing['embed_s']:.2f}s, write {timing['write_s']:.2f}s")
+
+        edited = sorted(os.listdir(corpus))[0]
+        with open(os.path.join(corpus, edited), "a", encoding="utf-8") as f:
+            f.write("\n\nappended paragraph for the incremental run.")
+        report = ingestor.ingest()
+        _line("incremental", len(report["updated"]), report["chunks_added"], report["timing"]["total_s"])
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+"""
+Exact-match completion cache in front of the model handlers.
+
+Entries are keyed on a canonical hash of (model, messages, system prompt,
+temperature). An in-memory LRU with TTL serves hot prompts; when
+COMPLETION_CACHE_DB is set, a SQLite tier keeps entries across restarts.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import logging
+from collections import OrderedDict
+from typing import List, Optional
+
+logger = logging.getLogger(__name__)
+
+CACHE_MAX_ENTRIES = int(os.getenv("COMPLETION_CACHE_SIZE", "1024"))
+CACHE_TTL_SECONDS = float(os.getenv("COMPLETION_CACHE_TTL", "3600"))
+CACHE_DB_PATH = os.getenv("COMPLETION_CACHE_DB", "").strip() or None
+
+
+def cache_key(model_key: str, messages: List[dict], system_prompt: Optional[str], temperature: float) -> str:
+    """Canonical sha256 over everything that determines a completion."""
+    canonical = json.dumps(
+        {
+            "model": model_key,
+            "messages": [{"role": m["role"], "content": m["content"]} for m in messages],
+            "system_prompt": system_prompt or "",
+            "temperature": round(float(temperature), 4),
+        },
+        sort_keys=True,
+        separators=(",", ":"),
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def is_cacheable(model_config: dict, temperature: float) -> bool:
+    """
+    Registry flags: `"cache": false` turns caching off for a model;
+    requests with temperature > 0 are only cached with `"cache_sampled": true`,
+    since replaying one sample to every caller removes the variety they asked for.
+    """
+    if not model_config.get("cache", True):
+        return False
+    if temperature > 0 and not model_config.get("cache_sampled", False):
+        return False
+    return True
+
+
+class _DiskTier:
+    """SQLite key/value store; calls are blocking and run via asyncio.to_thread."""
+
+    def __init__(self, path: str):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS completion_cache ("
+            " key TEXT PRIMARY KEY, value TEXT NOT NULL, created_at REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+    def get(self, key: str, ttl: float) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, created_at FROM completion_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if time.time() - row[1] > ttl:
+                self._conn.execute("DELETE FROM completion_cache WHERE key = ?", (key,))
+                self._conn.commit()
+                return None
+            return row[0]
+
+    def set(self, key: str, value: str):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO completion_cache (key, value, created_at) VALUES (?, ?, ?)",
+                (key, value, time.time()),
+            )
+            self._conn.commit()
+
+    def purge_expired(self, ttl: float) -> int:
+        with self._lock:
+            cur = self._conn.execute("DELETE FROM completion_cache WHERE created_at < ?", (time.time() - ttl,))
+            self._conn.commit()
+            return cur.rowcount
+
+
+class CompletionCache:
+    def __init__(self, max_entries: int = CACHE_MAX_ENTRIES, ttl_seconds: float = CACHE_TTL_SECONDS, db_path: Optional[str] = CACHE_DB_PATH):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._memory: "OrderedDict[str, tuple]" = OrderedDict()  # key -> (stored_at, value)
+        self._disk = _DiskTier(db_path) if db_path else None
+        if self._disk is not None:
+            purged = self._disk.purge_expired(ttl_seconds)
+            logger.info("Completion cache disk tier at %s (purged %s expired entries)", db_path, purged)
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.bypassed = 0
+
+    def _memory_get(self, key: str) -> Optional[str]:
+        item = self._memory.get(key)
+        if item is None:
+            return None
+        stored_at, value = item
+        if time.monotonic() - stored_at > self.ttl_seconds:
+            self._memory.pop(key, None)
+            return None
+        self._memory.move_to_end(key)
+        return value
+
+    def _memory_set(self, key: str, value: str):
+        self._memory[key] = (time.monotonic(), value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    async def get(self, key: str) -> Optional[str]:
+        value = self._memory_get(key)
+        if value is not None:
+            self.hits += 1
+            return value
+        if self._disk is not None:
+            value = await asyncio.to_thread(self._disk.get, key, self.ttl_seconds)
+            if value is not None:
+                self.hits += 1
+                self.disk_hits += 1
+                self._memory_set(key, value)
+                return value
+        self.misses += 1
+        return None
+
+    async def set(self, key: str, value: str):
+        self._memory_set(key, value)
+        if self._disk is not None:
+            await asyncio.to_thread(self._disk.set, key, value)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._memory),
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "bypassed": self.bypassed,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "disk_tier": self._disk is not None,
+        }
+
+
+completion_cache = CompletionCache()
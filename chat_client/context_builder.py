@@ -0,0 +1,153 @@
+"""
+Token-budgeted conversation context.
+
+Assembles system prompt + as much recent history as fits into a model's
+context window, counted with the model's real tokenizer (HF `tokenizers`)
+when one is configured. Counts are cached on each stored message under
+`tokens[<tokenizer>]`, so history is not re-tokenized every turn. Older
+turns are dropped oldest-first; the boundary message is tail-truncated when
+enough budget is left for it to be useful.
+"""
+import hashlib
+import os
+import threading
+import logging
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CONTEXT_WINDOW = int(os.getenv("LLM_DEFAULT_CONTEXT_WINDOW", "4096"))
+DEFAULT_MAX_OUTPUT_TOKENS = int(os.getenv("LLM_DEFAULT_MAX_OUTPUT_TOKENS", "1024"))
+MESSAGE_OVERHEAD_TOKENS = 4          # role/separator tokens added per chat message by most templates
+MIN_TRUNCATED_TOKENS = 64            # below this, a truncated message is dropped instead
+APPROX_TOKENIZER = "approx"          # chars/4 fallback when no tokenizer is available
+TRUNCATION_MARKER = "…"
+SUMMARY_PREFIX = "Summary of the earlier conversation:\n"
+
+_tokenizers: Dict[str, object] = {}
+_tokenizers_lock = threading.Lock()
+_count_cache: "OrderedDict[tuple, int]" = OrderedDict()   # (tokenizer, sha1(text)) -> count
+_count_cache_lock = threading.Lock()
+COUNT_CACHE_SIZE = 8192
+
+
+def _load_tokenizer(name: str):
+    with _tokenizers_lock:
+        if name in _tokenizers:
+            return _tokenizers[name]
+        try:
+            from tokenizers import Tokenizer
+            tokenizer = Tokenizer.from_pretrained(name)
+        except Exception as e:  # missing package, offline, gated repo...
+            logger.warning("Tokenizer %s unavailable (%s); counting its models' tokens as chars/4 "
+                           "(gated repos need HF_TOKEN or an ungated mirror in the registry)", name, e)
+            tokenizer = None
+        _tokenizers[name] = tokenizer
+        return tokenizer
+
+
+class TokenCounter:
+    def __init__(self, tokenizer_name: Optional[str]):
+        self._tokenizer = _load_tokenizer(tokenizer_name) if tokenizer_name else None
+        self.name = tokenizer_name if self._tokenizer is not None else APPROX_TOKENIZER
+
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+        cache_key = (self.name, hashlib.sha1(text.encode("utf-8")).digest())
+        with _count_cache_lock:
+            cached = _count_cache.get(cache_key)
+            if cached is not None:
+                _count_cache.move_to_end(cache_key)
+                return cached
+        if self._tokenizer is not None:
+            n = len(self._tokenizer.encode(text, add_special_tokens=False).ids)
+        else:
+            n = (len(text) + 3) // 4
+        with _count_cache_lock:
+            _count_cache[cache_key] = n
+            if len(_count_cache) > COUNT_CACHE_SIZE:
+                _count_cache.popitem(last=False)
+        return n
+
+    def message_tokens(self, message: dict) -> int:
+        """Token count for a stored message, reusing the count cached on it when present."""
+        cached = (message.get("tokens") or {}).get(self.name)
+        if cached is None:
+            cached = self.count(message.get("content", ""))
+        return cached + MESSAGE_OVERHEAD_TOKENS
+
+    def truncate_tail(self, text: str, max_tokens: int) -> str:
+        """Keep the last `max_tokens` tokens of `text` (the most recent part of a long message)."""
+        if self._tokenizer is not None:
+            encoding = self._tokenizer.encode(text, add_special_tokens=False)
+            if len(encoding.ids) <= max_tokens:
+                return text
+            start = encoding.offsets[len(encoding.ids) - max_tokens][0]
+            return TRUNCATION_MARKER + text[start:]
+        max_chars = max_tokens * 4
+        return text if len(text) <= max_chars else TRUNCATION_MARKER + text[-max_chars:]
+
+
+_counters: Dict[str, TokenCounter] = {}
+
+
+def get_token_counter(model_config: dict) -> TokenCounter:
+    name = model_config.get("tokenizer") or ""
+    counter = _counters.get(name)
+    if counter is None:
+        counter = _counters.setdefault(name, TokenCounter(name or None))
+    return counter
+
+
+def message_token_cache(model_config: dict, content: str) -> dict:
+    """The `tokens` value to store on a new message for this model's tokenizer."""
+    counter = get_token_counter(model_config)
+    return {counter.name: counter.count(content)}
+
+
+def build_context(model_config: dict, prompt: str, system_prompt: Optional[str] = None,
+                  history: Optional[List[dict]] = None, summary: Optional[str] = None) -> List[dict]:
+    """
+    Return the chat `messages` for a request: system prompt, the rolling summary
+    of older turns (if any), the newest history that fits the model's window
+    (minus the output reserve), and the new prompt.
+    """
+    counter = get_token_counter(model_config)
+    window = model_config.get("context_window", DEFAULT_CONTEXT_WINDOW)
+    budget = window - model_config.get("max_output_tokens", DEFAULT_MAX_OUTPUT_TOKENS)
+
+    head = []
+    if system_prompt:
+        head.append({"role": "system", "content": system_prompt})
+        budget -= counter.count(system_prompt) + MESSAGE_OVERHEAD_TOKENS
+    if summary:
+        summary_text = SUMMARY_PREFIX + summary
+        head.append({"role": "system", "content": summary_text})
+        budget -= counter.count(summary_text) + MESSAGE_OVERHEAD_TOKENS
+
+    prompt_tokens = counter.count(prompt) + MESSAGE_OVERHEAD_TOKENS
+    if prompt_tokens > budget:
+        prompt = counter.truncate_tail(prompt, max(budget - MESSAGE_OVERHEAD_TOKENS, MIN_TRUNCATED_TOKENS))
+        prompt_tokens = budget
+    budget -= prompt_tokens
+
+    kept: List[dict] = []
+    for message in reversed(history or []):
+        if message.get("role") not in ("user", "assistant"):
+            continue
+        needed = counter.message_tokens(message)
+        if needed <= budget:
+            kept.append({"role": message["role"], "content": message["content"]})
+            budget -= needed
+            continue
+        if budget - MESSAGE_OVERHEAD_TOKENS >= MIN_TRUNCATED_TOKENS:
+            kept.append({
+                "role": message["role"],
+                "content": counter.truncate_tail(message["content"], budget - MESSAGE_OVERHEAD_TOKENS),
+            })
+        break
+
+    kept.reverse()
+    return head + kept + [{"role": "user", "content": prompt}]
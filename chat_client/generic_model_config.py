@@ -1,16 +1,18 @@
-from importlib import import_module
+import asyncio
 import os
 import json
-import requests
-from dotenv import load_dotenv
+import logging
 
+from chat_client.context_builder import DEFAULT_MAX_OUTPUT_TOKENS, build_context
+from chat_client.completion_cache import cache_key, completion_cache, is_cacheable
+from chat_client.semantic_cache import semantic_cache
+from chat_client.router import ModelRouter, HEDGE_PERCENTILE, routes_from_config
+from chat_client.singleflight import SingleFlight
+from chat_client.transport import ProviderError
 
-load_dotenv(dotenv_path=os.path.join(os.path.dirname(os.path.dirname(__file__)), ".env"))
+logger = logging.getLogger(__name__)
 
-TOGETHER_API_KEY = os.getenv("TOGETHER_API")
-TOGETHER_BASE_URL = os.getenv("TOGETHER_URL")
-
-print(f'TOGETHER_API_KEY=>\t{TOGETHER_API_KEY}\nTOGETHER_BASE_URL=>\t{TOGETHER_BASE_URL}')
+DEFAULT_TEMPERATURE = 0.7
 
 
 def read_model_config():
@@ -21,34 +23,128 @@ def read_model_config():
     
 MODEL_REGISTRY = read_model_config()
 
-def get_model_handler(model_key):
+# Coalesces identical in-flight completions (keyed like the completion cache), cacheable or not:
+# concurrent callers of a sampled request share one sample, later ones draw a new one.
+inflight = SingleFlight("llm")
+
+# One router per logical model, so breakers and latency history survive across requests.
+_routers = {}
+
+def get_model_router(model_key) -> ModelRouter:
     model_config = MODEL_REGISTRY.get(model_key)
 
     if not model_config:
         raise ValueError("Invalid model key.")
 
-    def handler(prompt: str):
-        headers = {
-            "Authorization": f"Bearer {TOGETHER_API_KEY}",
-            "Content-Type": "application/json"
-        }
-        payload = {
-            "model": model_config["id"],
-            "messages": [
-                {"role": "user", "content": prompt}
-            ],
-            "temperature": 0.7,
+    router = _routers.get(model_key)
+    if router is None:
+        router = ModelRouter(
+            model_key,
+            routes_from_config(model_config),
+            hedge_percentile=model_config.get("hedge_percentile", HEDGE_PERCENTILE),
+        )
+        _routers[model_key] = router
+    return router
+
+def router_stats():
+    return {model_key: router.stats() for model_key, router in _routers.items()}
+
+async def _build_messages(model_key, prompt: str, system_prompt: str | None, history, summary):
+    # Tokenizing long histories (and the first tokenizer load) is CPU/IO work; keep it off the loop.
+    return await asyncio.to_thread(build_context, MODEL_REGISTRY[model_key], prompt, system_prompt, history, summary)
+
+def _payload_builder(model_config, messages, temperature: float):
+    # build_context reserved max_output_tokens of the window for the reply; cap it to match.
+    max_tokens = model_config.get("max_output_tokens", DEFAULT_MAX_OUTPUT_TOKENS)
+
+    def build(provider_model_id: str):
+        return {
+            "model": provider_model_id,
+            "messages": messages,
+            "temperature": temperature,
+            "max_tokens": max_tokens,
         }
+    return build
+
+async def _cache_lookup(model_key, prompt, messages, system_prompt, temperature, history, summary, public=False):
+    """
+    Try the exact-match cache, then (public requests on opted-in models only) the semantic cache.
+    Returns `(cached_answer, store, key)`: call `await store(answer)` after a provider miss;
+    `key` is the canonical request key, also used to coalesce requests the cache skips.
+    """
+    model_config = MODEL_REGISTRY[model_key]
+    key = cache_key(model_key, messages, system_prompt, temperature)
+    if not is_cacheable(model_config, temperature):
+        completion_cache.bypassed += 1
 
-        response = requests.post(TOGETHER_BASE_URL, json=payload, headers=headers)
-        result = response.json()
+        async def _no_store(answer):
+            return None
+        return None, _no_store, key
 
-        if "choices" in result and result["choices"]:
-            return result["choices"][0]["message"]["content"]
-        else:
+    cached = await completion_cache.get(key)
+    if cached is not None:
+        return cached, None, key
+
+    # Similar is not identical (a number, a "not"): only shared public/FAQ answers may be reused,
+    # and prompt similarity only means "same answer" for a fresh conversation.
+    use_semantic = public and model_config.get("semantic_cache", False) and not history and not summary
+    vector = None
+    if use_semantic:
+        cached, vector = await semantic_cache.get(
+            model_key, system_prompt, prompt, threshold=model_config.get("semantic_threshold")
+        )
+        if cached is not None:
+            return cached, None, key
+
+    async def _store(answer):
+        await completion_cache.set(key, answer)
+        if use_semantic:
+            await semantic_cache.set(model_key, system_prompt, prompt, answer, vector=vector)
+    return None, _store, key
+
+def get_model_handler(model_key):
+    router = get_model_router(model_key)
+
+    async def handler(prompt: str, system_prompt: str | None = None, temperature: float = DEFAULT_TEMPERATURE, history=None, summary=None, public=False):
+        messages = await _build_messages(model_key, prompt, system_prompt, history, summary)
+        cached, store, key = await _cache_lookup(model_key, prompt, messages, system_prompt, temperature, history, summary, public)
+        if cached is not None:
+            return cached
+
+        async def call():
+            content = await router.complete(_payload_builder(MODEL_REGISTRY[model_key], messages, temperature))
+            await store(content)
+            return content
+
+        try:
+            # Identical concurrent requests share one upstream call.
+            return await inflight.do(key, call)
+        except ProviderError as e:
+            logger.warning("Model call failed for %s: %s", model_key, e)
             return "⚠️ No response received from the model."
 
     return handler
 
+def get_model_stream_handler(model_key):
+    """Like get_model_handler, but the returned handler is an async generator of content deltas."""
+    router = get_model_router(model_key)
+
+    async def stream_handler(prompt: str, system_prompt: str | None = None, temperature: float = DEFAULT_TEMPERATURE, history=None, summary=None):
+        messages = await _build_messages(model_key, prompt, system_prompt, history, summary)
+        cached, store, key = await _cache_lookup(model_key, prompt, messages, system_prompt, temperature, history, summary)
+        if cached is not None:
+            yield cached
+            return
+
+        async def upstream():
+            parts = []
+            async for delta in router.stream(_payload_builder(MODEL_REGISTRY[model_key], messages, temperature)):
+                parts.append(delta)
+                yield delta
+            if parts:
+                await store("".join(parts))
 
+        async for delta in inflight.stream(key, upstream):
+            yield delta
 
+    return stream_handler
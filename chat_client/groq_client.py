@@ -1,53 +1,37 @@
-import os
-import requests
-from dotenv import load_dotenv
+import logging
 
-load_dotenv(dotenv_path=os.path.join(os.path.dirname(os.path.dirname(__file__)), ".env"))
+from chat_client.transport import ProviderError, post_chat, first_choice_content
 
-# GROQ_API_KEY = "gsk_test_..."  # replace with your key
-GROQ_API_KEY = os.getenv("groq-api")
-GROQ_URL = "https://api.groq.com/openai/v1/chat/completions"
+logger = logging.getLogger(__name__)
 
+GROQ_MODEL = "llama3-70b-8192"
 
-def chat_with_groq(prompt):
-    headers = {
-        "Authorization": f"Bearer {GROQ_API_KEY}",
-        "Content-Type": "application/json"
-    }
 
+async def chat_with_groq(prompt):
     data = {
-        "model": "llama3-70b-8192",
+        "model": GROQ_MODEL,
         "messages": [{"role": "user", "content": prompt}]
     }
 
-    response = requests.post(GROQ_URL, headers=headers, json=data)
-
     try:
-        response.raise_for_status()
-        result = response.json()
-        print(f'result=>\t{result["choices"][0]["message"]["content"]}')
-        return result["choices"][0]["message"]["content"]
-    except Exception as e:
-        print("ERROR:", response.status_code, response.text)
+        result = await post_chat("groq", data)
+        content = first_choice_content(result)
+        logger.debug("Groq reply: %s", content)
+        return content
+    except ProviderError as e:
+        logger.warning("Groq call failed (%s): %s", e.status_code, e)
         return f"Failed to fetch response: {e}"
     
 
-def chat_with_groq_new(prompt):
-    headers = {
-        "Authorization": f"Bearer {GROQ_API_KEY}",
-        "Content-Type": "application/json"
-    }
-
+async def chat_with_groq_new(prompt):
     data = {
-        "model": "llama3-70b-8192",
+        "model": GROQ_MODEL,
         "messages": [{"role": "user", "content": prompt}]
     }
 
-    response = requests.post(GROQ_URL, headers=headers, json=data)
     try:
-        response.raise_for_status()
-        result = response.json()
-        return result["choices"][0]["message"]["content"]
-    except Exception as e:
-        print("ERROR:", response.status_code, response.text)
+        result = await post_chat("groq", data)
+        return first_choice_content(result)
+    except ProviderError as e:
+        logger.warning("Groq call failed (%s): %s", e.status_code, e)
         return f"Error: {e}"
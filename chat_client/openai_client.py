@@ -1,20 +1,23 @@
-import os
-import openai
+import asyncio
 
-# Set your API key here (or from environment variable)
-openai.api_key = os.getenv("OPENAI_API_KEY") or "sk-xxxx"
+from chat_client.transport import aclose, post_chat, first_choice_content
 
-def ask_chat(prompt):       # OpenAI [Future purpose]
-    response = openai.ChatCompletion.create(
-        model="gpt-3.5-turbo",  # You can use "gpt-4o" if you have access
-        messages=[{"role": "user", "content": prompt}]
-    )
-    return response.choices[0].message['content']
 
-if __name__ == "__main__":
+async def ask_chat(prompt):       # OpenAI [Future purpose]
+    response = await post_chat("openai", {
+        "model": "gpt-3.5-turbo",  # You can use "gpt-4o" if you have access
+        "messages": [{"role": "user", "content": prompt}]
+    })
+    return first_choice_content(response)
+
+async def _repl():
     while True:
         user_input = input("You: ")
         if user_input.lower() in ['exit', 'quit']:
             break
-        reply = ask_chat(user_input)
+        reply = await ask_chat(user_input)
         print("AI:", reply)
+    await aclose()
+
+if __name__ == "__main__":
+    asyncio.run(_repl())
@@ -0,0 +1,227 @@
+"""
+Provider routing for models served by more than one backend.
+
+Each route (provider + provider-side model id) has its own circuit breaker
+and latency history. A request goes to the first healthy route; if it has
+not answered by the route's configured latency percentile, a hedged request
+is sent to the next healthy route and whichever answers first wins. Errors
+fail over to the next route immediately.
+"""
+import asyncio
+import os
+import time
+import logging
+from collections import deque
+from typing import Callable, Dict, List, Optional
+
+from chat_client.transport import ProviderError, post_chat, stream_chat, first_choice_content
+
+logger = logging.getLogger(__name__)
+
+# ---------- Tuning ----------
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("LLM_BREAKER_FAILURES", "5"))
+BREAKER_RESET_SECONDS = float(os.getenv("LLM_BREAKER_RESET_SECONDS", "30"))
+HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", "95"))
+HEDGE_DEFAULT_DELAY = float(os.getenv("LLM_HEDGE_DEFAULT_DELAY", "8"))
+HEDGE_MIN_SAMPLES = 20
+LATENCY_WINDOW = 200
+
+
+class CircuitBreaker:
+    """closed -> open after N consecutive failures -> half-open after a cool-down."""
+
+    def __init__(self, failure_threshold: int = BREAKER_FAILURE_THRESHOLD, reset_seconds: float = BREAKER_RESET_SECONDS):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.half_open_probe = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_seconds:
+            return "half-open"
+        return "open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half-open" and not self.half_open_probe:
+            # Let exactly one probe through until it reports back.
+            self.half_open_probe = True
+            return True
+        return False
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self.half_open_probe = False
+
+    def record_failure(self):
+        self.failures += 1
+        self.half_open_probe = False
+        if self.opened_at is not None or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+
+
+class Route:
+    def __init__(self, provider: str, model_id: str):
+        self.provider = provider
+        self.model_id = model_id
+        self.breaker = CircuitBreaker()
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self.calls = 0
+        self.errors = 0
+        self.backup_wins = 0
+
+    @property
+    def name(self) -> str:
+        return f"{self.provider}:{self.model_id}"
+
+    def latency_percentile(self, pct: float) -> Optional[float]:
+        if len(self.latencies) < HEDGE_MIN_SAMPLES:
+            return None
+        ordered = sorted(self.latencies)
+        index = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+        return ordered[index]
+
+    def stats(self) -> dict:
+        return {
+            "route": self.name,
+            "state": self.breaker.state,
+            "calls": self.calls,
+            "errors": self.errors,
+            "backup_wins": self.backup_wins,
+            "p50_s": self.latency_percentile(50),
+            "p95_s": self.latency_percentile(95),
+        }
+
+
+class ModelRouter:
+    def __init__(self, model_key: str, routes: List[Route], hedge_percentile: float = HEDGE_PERCENTILE):
+        self.model_key = model_key
+        self.routes = routes
+        self.hedge_percentile = hedge_percentile
+
+    def _hedge_delay(self, route: Route) -> float:
+        delay = route.latency_percentile(self.hedge_percentile)
+        return delay if delay is not None else HEDGE_DEFAULT_DELAY
+
+    def _candidates(self):
+        # Lazy, so a half-open breaker only hands out its probe when the route is actually used.
+        return (r for r in self.routes if r.breaker.allow())
+
+    async def _call(self, route: Route, build_payload: Callable[[str], dict]) -> str:
+        route.calls += 1
+        started = time.monotonic()
+        try:
+            result = await post_chat(route.provider, build_payload(route.model_id))
+            content = first_choice_content(result)
+            if content is None:
+                raise ProviderError(route.provider, "Empty completion.")
+        except asyncio.CancelledError:
+            # Lost a hedge race; not the route's fault.
+            route.breaker.half_open_probe = False
+            raise
+        except Exception:
+            route.errors += 1
+            route.breaker.record_failure()
+            raise
+        route.latencies.append(time.monotonic() - started)
+        route.breaker.record_success()
+        return content
+
+    async def complete(self, build_payload: Callable[[str], dict]) -> str:
+        """Return the first successful completion across this model's routes."""
+        candidates = self._candidates()
+        pending: Dict[asyncio.Task, Route] = {}
+        errors = []
+
+        def launch() -> Optional[Route]:
+            route = next(candidates, None)
+            if route is not None:
+                pending[asyncio.create_task(self._call(route, build_payload))] = route
+            return route
+
+        primary = last = launch()
+        if primary is None:
+            raise ProviderError(self.model_key, "All provider routes are unavailable (circuit open).")
+        has_more = True
+        try:
+            while pending:
+                timeout = self._hedge_delay(last) if has_more else None
+                done, _ = await asyncio.wait(pending.keys(), timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    # Slow primary: hedge onto the next healthy route.
+                    nxt = launch()
+                    if nxt is None:
+                        has_more = False
+                    else:
+                        logger.info("Hedging %s: %s -> %s", self.model_key, last.name, nxt.name)
+                        last = nxt
+                    continue
+                for task in done:
+                    route = pending.pop(task)
+                    if task.exception() is None:
+                        if route is not primary:
+                            route.backup_wins += 1
+                        return task.result()
+                    errors.append(task.exception())
+                    logger.warning("Route %s failed for %s: %s", route.name, self.model_key, task.exception())
+                if not pending:
+                    nxt = launch()
+                    if nxt is None:
+                        break
+                    last = nxt
+        finally:
+            for task in pending:
+                task.cancel()
+        raise ProviderError(self.model_key, f"All routes failed: {'; '.join(str(e) for e in errors)}")
+
+    async def stream(self, build_payload: Callable[[str], dict]):
+        """
+        Stream deltas from the first healthy route. Streams are not hedged (the
+        client would see two token streams); a route that fails before its first
+        token fails over to the next one.
+        """
+        errors = []
+        tried = False
+        for route in self._candidates():
+            tried = True
+            route.calls += 1
+            started = time.monotonic()
+            first_token = False
+            try:
+                async for delta in stream_chat(route.provider, build_payload(route.model_id)):
+                    if not first_token:
+                        first_token = True
+                        route.latencies.append(time.monotonic() - started)
+                    yield delta
+            except ProviderError as e:
+                route.errors += 1
+                route.breaker.record_failure()
+                if first_token:
+                    raise
+                errors.append(e)
+                logger.warning("Stream route %s failed for %s: %s", route.name, self.model_key, e)
+                continue
+            except (asyncio.CancelledError, GeneratorExit):
+                route.breaker.half_open_probe = False
+                raise
+            route.breaker.record_success()
+            return
+        if not tried:
+            raise ProviderError(self.model_key, "All provider routes are unavailable (circuit open).")
+        raise ProviderError(self.model_key, f"All routes failed: {'; '.join(str(e) for e in errors)}")
+
+    def stats(self) -> List[dict]:
+        return [route.stats() for route in self.routes]
+
+
+def routes_from_config(model_config: dict) -> List[Route]:
+    """Build routes from a registry entry: `routes: [{provider, id}, ...]` or the legacy `provider`/`id` pair."""
+    entries = model_config.get("routes") or [{"provider": model_config.get("provider", "together"), "id": model_config["id"]}]
+    return [Route(entry["provider"], entry["id"]) for entry in entries]
@@ -0,0 +1,201 @@
+"""
+Semantic response cache for chat.
+
+Prompts are embedded with the same MiniLM model the RAG tools use, and a
+stored answer is served when an earlier prompt for the same model and system
+prompt is close enough (cosine similarity >= the model's threshold). The
+index is a fixed number of slots with LRU eviction, so memory stays bounded.
+Entries older than SEMANTIC_CACHE_TTL are never served: a lookup that finds
+them frees their slots, and a partition is dropped once it is empty. Near-miss prompts
+can match, so it is opt-in per model and only used for the public guest
+endpoint, never for answers given to a logged-in user.
+"""
+import asyncio
+import hashlib
+import os
+import threading
+import time
+import logging
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "1") == "1"
+SEMANTIC_CACHE_SIZE = int(os.getenv("SEMANTIC_CACHE_SIZE", "4096"))
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.92"))
+SEMANTIC_CACHE_TTL = float(os.getenv("SEMANTIC_CACHE_TTL", "3600"))
+
+_model = None
+_model_lock = threading.Lock()
+
+
+def _get_embedder():
+    """Load the sentence-transformers model once; returns None if the dependency is missing."""
+    global _model
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                try:
+                    from sentence_transformers import SentenceTransformer
+                except ImportError:
+                    logger.warning("sentence-transformers not installed; semantic cache disabled")
+                    _model = False
+                else:
+                    _model = SentenceTransformer(EMBEDDING_MODEL_NAME)
+    return _model or None
+
+
+def _embed(text: str):
+    embedder = _get_embedder()
+    if embedder is None:
+        return None
+    return embedder.encode(text, normalize_embeddings=True, convert_to_numpy=True).astype("float32")
+
+
+class SemanticCache:
+    def __init__(self, capacity: int = SEMANTIC_CACHE_SIZE, default_threshold: float = SEMANTIC_CACHE_THRESHOLD,
+                 ttl: float = SEMANTIC_CACHE_TTL):
+        self.capacity = capacity
+        self.default_threshold = default_threshold
+        self.ttl = ttl
+        self._vectors = None                    # (capacity, dim) unit vectors, allocated on first insert
+        self._partition = None                  # (capacity,) partition id per slot, -1 = free
+        self._inserted_at = None                # (capacity,) time.monotonic() of each insert
+        self._answers: Dict[int, str] = {}
+        self._lru: "OrderedDict[int, None]" = OrderedDict()
+        self._free: List[int] = []              # slots freed by expiry, reused before evicting
+        self._next_slot = 0                     # slots below this have been handed out
+        self._partitions: Dict[Tuple[str, str], int] = {}
+        self._partition_keys: Dict[int, Tuple[str, str]] = {}
+        self._partition_sizes: Dict[int, int] = {}
+        self._next_pid = 0
+        self.lookups = 0
+        self.hits = 0
+        self.inserts = 0
+        self.evictions = 0
+        self.expired = 0
+        self.hit_similarity_total = 0.0
+
+    @staticmethod
+    def _partition_key(model_key: str, system_prompt: Optional[str]) -> Tuple[str, str]:
+        return model_key, hashlib.sha256((system_prompt or "").encode("utf-8")).hexdigest()
+
+    def _partition_id(self, key: Tuple[str, str]) -> int:
+        pid = self._partitions.get(key)
+        if pid is None:
+            pid, self._next_pid = self._next_pid, self._next_pid + 1
+            self._partitions[key] = pid
+            self._partition_keys[pid] = key
+            self._partition_sizes[pid] = 0
+        return pid
+
+    def _release(self, slot: int):
+        """Take `slot` out of its partition, dropping the partition once it is empty."""
+        pid = int(self._partition[slot])
+        self._partition[slot] = -1
+        self._answers.pop(slot, None)
+        self._partition_sizes[pid] -= 1
+        if not self._partition_sizes[pid]:
+            del self._partition_sizes[pid]
+            del self._partitions[self._partition_keys.pop(pid)]
+
+    def _allocate(self, dim: int):
+        import numpy as np
+        self._vectors = np.zeros((self.capacity, dim), dtype="float32")
+        self._partition = np.full(self.capacity, -1, dtype="int64")
+        self._inserted_at = np.zeros(self.capacity, dtype="float64")
+
+    def _lookup(self, vector, pid: int, threshold: float) -> Optional[Tuple[int, float]]:
+        import numpy as np
+        if self._vectors is None:
+            return None
+        # Any expired answer (in any partition) stops counting toward capacity; its slot is reused first.
+        stale = (self._partition >= 0) & (self._inserted_at < time.monotonic() - self.ttl)
+        if stale.any():
+            for slot in np.nonzero(stale)[0].tolist():
+                self._release(slot)
+                del self._lru[slot]
+                self._free.append(slot)
+            self.expired += int(stale.sum())
+        if pid not in self._partition_sizes:
+            return None
+        in_partition = self._partition == pid
+        candidates = np.nonzero(in_partition)[0]
+        if candidates.size == 0:
+            return None
+        scores = self._vectors[candidates] @ vector
+        best = int(np.argmax(scores))
+        score = float(scores[best])
+        if score < threshold:
+            return None
+        return int(candidates[best]), score
+
+    def _insert(self, vector, key: Tuple[str, str], answer: str):
+        if self._vectors is None:
+            self._allocate(vector.shape[0])
+        # Expired slots first, then fresh ones until full, then recycled in LRU order.
+        if self._free:
+            slot = self._free.pop()
+        elif self._next_slot < self.capacity:
+            slot, self._next_slot = self._next_slot, self._next_slot + 1
+        else:
+            slot, _ = self._lru.popitem(last=False)
+            self._release(slot)
+            self.evictions += 1
+        pid = self._partition_id(key)          # after eviction, which may have emptied this partition
+        self._vectors[slot] = vector
+        self._partition[slot] = pid
+        self._partition_sizes[pid] += 1
+        self._inserted_at[slot] = time.monotonic()
+        self._answers[slot] = answer
+        self._lru[slot] = None
+        self.inserts += 1
+
+    async def get(self, model_key: str, system_prompt: Optional[str], prompt: str, threshold: Optional[float] = None):
+        """Return `(answer, embedding)`; the embedding is reused by `set` on a miss."""
+        if not SEMANTIC_CACHE_ENABLED:
+            return None, None
+        # Embedding (and the first model load) is CPU work; keep it off the event loop.
+        vector = await asyncio.to_thread(_embed, prompt)
+        if vector is None:
+            return None, None
+        self.lookups += 1
+        pid = self._partitions.get(self._partition_key(model_key, system_prompt), -1)
+        found = self._lookup(vector, pid, threshold or self.default_threshold)
+        if found is None:
+            return None, vector
+        slot, score = found
+        self._lru.move_to_end(slot)
+        self.hits += 1
+        self.hit_similarity_total += score
+        return self._answers[slot], vector
+
+    async def set(self, model_key: str, system_prompt: Optional[str], prompt: str, answer: str, vector=None):
+        if not SEMANTIC_CACHE_ENABLED:
+            return
+        if vector is None:
+            vector = await asyncio.to_thread(_embed, prompt)
+            if vector is None:
+                return
+        self._insert(vector, self._partition_key(model_key, system_prompt), answer)
+
+    def stats(self) -> dict:
+        return {
+            "enabled": SEMANTIC_CACHE_ENABLED,
+            "entries": len(self._lru),
+            "partitions": len(self._partitions),
+            "capacity": self.capacity,
+            "lookups": self.lookups,
+            "hits": self.hits,
+            "provider_calls_saved": self.hits,
+            "inserts": self.inserts,
+            "evictions": self.evictions,
+            "expired": self.expired,
+            "ttl_s": self.ttl,
+            "avg_hit_similarity": round(self.hit_similarity_total / self.hits, 4) if self.hits else None,
+        }
+
+
+semantic_cache = SemanticCache()
@@ -0,0 +1,120 @@
+"""
+Single-flight coalescing of identical in-flight work.
+
+Concurrent callers asking for the same key share one upstream call. For
+streams, every subscriber receives the same chunks (late joiners get the
+chunks produced so far replayed first). Cancellation is reference-counted:
+the upstream call is cancelled only when its last waiter goes away, and a
+cancelled call is never joined by later callers.
+"""
+import asyncio
+import logging
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class _Flight:
+    def __init__(self):
+        self.task: Optional[asyncio.Task] = None
+        self.waiters = 0
+        self.chunks: List = []
+        self.finished = False
+        self.error: Optional[BaseException] = None
+        self.changed = asyncio.Event()
+
+    def notify(self):
+        event, self.changed = self.changed, asyncio.Event()
+        event.set()
+
+
+class SingleFlight:
+    def __init__(self, name: str):
+        self.name = name
+        self._flights: Dict[str, _Flight] = {}
+        self._streams: Dict[str, _Flight] = {}
+        self.started = 0
+        self.coalesced = 0
+        self.cancelled = 0
+
+    def _forget(self, table: Dict[str, _Flight], key: str, flight: _Flight):
+        if table.get(key) is flight:
+            del table[key]
+
+    def _release(self, table: Dict[str, _Flight], key: str, flight: _Flight):
+        flight.waiters -= 1
+        if flight.waiters == 0 and flight.task is not None and not flight.task.done():
+            self.cancelled += 1
+            flight.task.cancel()
+            # The task may take a while to unwind; new callers must start a fresh flight, not join this one.
+            self._forget(table, key, flight)
+
+    async def do(self, key: str, factory: Callable[[], Awaitable]):
+        """Run `factory()` once per key among concurrent callers and share its result."""
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = _Flight()
+            flight.task = asyncio.create_task(factory())
+            flight.task.add_done_callback(lambda _t, k=key, f=flight: self._forget(self._flights, k, f))
+            self._flights[key] = flight
+            self.started += 1
+        else:
+            self.coalesced += 1
+
+        flight.waiters += 1
+        try:
+            # shield: one waiter going away must not cancel the shared call for the others.
+            return await asyncio.shield(flight.task)
+        finally:
+            self._release(self._flights, key, flight)
+
+    async def stream(self, key: str, factory: Callable[[], AsyncIterator]) -> AsyncIterator:
+        """Share one upstream async iterator per key among concurrent subscribers."""
+        flight = self._streams.get(key)
+        if flight is None:
+            flight = _Flight()
+            flight.task = asyncio.create_task(self._pump(flight, factory))
+            flight.task.add_done_callback(lambda _t, k=key, f=flight: self._forget(self._streams, k, f))
+            self._streams[key] = flight
+            self.started += 1
+        else:
+            self.coalesced += 1
+
+        flight.waiters += 1
+        try:
+            position = 0
+            while True:
+                if position < len(flight.chunks):
+                    chunk = flight.chunks[position]
+                    position += 1
+                    yield chunk
+                    continue
+                if flight.finished:
+                    if flight.error is not None:
+                        raise flight.error
+                    return
+                await flight.changed.wait()
+        finally:
+            self._release(self._streams, key, flight)
+
+    async def _pump(self, flight: _Flight, factory: Callable[[], AsyncIterator]):
+        try:
+            async for chunk in factory():
+                flight.chunks.append(chunk)
+                flight.notify()
+        except asyncio.CancelledError:
+            flight.error = asyncio.CancelledError()
+            raise
+        except Exception as e:
+            flight.error = e
+        finally:
+            flight.finished = True
+            flight.notify()
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": len(self._flights) + len(self._streams),
+            "started": self.started,
+            "coalesced": self.coalesced,
+            "cancelled": self.cancelled,
+        }
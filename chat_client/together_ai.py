@@ -1,18 +1,7 @@
-import requests
-import os
-from dotenv import load_dotenv
+from chat_client.transport import ProviderError, post_chat, first_choice_content
 
-load_dotenv(dotenv_path=os.path.join(os.path.dirname(os.path.dirname(__file__)), ".env"))
-
-TOGETHER_API_KEY = os.getenv("together-api")
-TOGETHER_URL = os.getenv("together-url")
-
-def chat_with_together(prompt):
-    headers = {
-        "Authorization": f"Bearer {TOGETHER_API_KEY}",
-        "Content-Type": "application/json"
-    }
 
+async def chat_with_together(prompt):
     data = {
         "model": "meta-llama-3-70b-instruct",  # or try another from their supported list
         "messages": [
@@ -20,15 +9,13 @@ def chat_with_together(prompt):
         ]
     }
 
-    response = requests.post(TOGETHER_URL, headers=headers, json=data)
+    try:
+        response_json = await post_chat("together", data)
+    except ProviderError as e:
+        return f"Error: {e}"
 
-    # Debug output
-    print("DEBUG:", response.status_code, response.text)
-
-    response_json = response.json()
-    if "choices" in response_json:
-        return response_json["choices"][0]["message"]["content"]
+    content = first_choice_content(response_json)
+    if content is not None:
+        return content
     else:
         return f"Error: {response_json.get('error', 'Unknown error')}"
-
-
@@ -0,0 +1,163 @@
+"""
+Shared async HTTP transport for every LLM provider.
+
+One keep-alive connection pool (httpx.AsyncClient) is kept per provider and
+each provider gets its own in-flight limit, so a single worker can keep
+hundreds of completions running without stalling the event loop.
+"""
+import asyncio
+import json
+import os
+import logging
+from typing import AsyncIterator, Dict, Optional
+
+import httpx
+from dotenv import load_dotenv
+
+load_dotenv(dotenv_path=os.path.join(os.path.dirname(os.path.dirname(__file__)), ".env"))
+
+logger = logging.getLogger(__name__)
+
+# ---------- Provider endpoints ----------
+PROVIDERS = {
+    "together": {
+        "url": os.getenv("TOGETHER_URL") or os.getenv("together-url") or "https://api.together.xyz/v1/chat/completions",
+        "api_key": os.getenv("TOGETHER_API") or os.getenv("together-api"),
+    },
+    "groq": {
+        "url": os.getenv("GROQ_URL") or "https://api.groq.com/openai/v1/chat/completions",
+        "api_key": os.getenv("GROQ_API") or os.getenv("groq-api"),
+    },
+    "openai": {
+        "url": os.getenv("OPENAI_URL") or "https://api.openai.com/v1/chat/completions",
+        "api_key": os.getenv("OPENAI_API_KEY"),
+    },
+}
+
+# ---------- Pool / timeout tuning ----------
+CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "5"))
+READ_TIMEOUT = float(os.getenv("LLM_READ_TIMEOUT", "60"))
+POOL_TIMEOUT = float(os.getenv("LLM_POOL_TIMEOUT", "10"))
+MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "200"))
+MAX_KEEPALIVE = int(os.getenv("LLM_MAX_KEEPALIVE", "50"))
+MAX_IN_FLIGHT = int(os.getenv("LLM_MAX_IN_FLIGHT", "256"))
+
+_clients: Dict[str, httpx.AsyncClient] = {}
+_in_flight: Dict[str, asyncio.Semaphore] = {}
+
+
+class ProviderError(Exception):
+    """Raised when a provider call fails (network, timeout, HTTP or payload error)."""
+
+    def __init__(self, provider: str, message: str, status_code: Optional[int] = None):
+        super().__init__(f"[{provider}] {message}")
+        self.provider = provider
+        self.status_code = status_code
+
+
+def _provider_config(provider: str) -> dict:
+    config = PROVIDERS.get(provider)
+    if not config:
+        raise ProviderError(provider, "Unknown provider.")
+    return config
+
+
+def get_client(provider: str) -> httpx.AsyncClient:
+    """Return the pooled client for `provider`, creating it on first use."""
+    client = _clients.get(provider)
+    if client is None or client.is_closed:
+        config = _provider_config(provider)
+        client = httpx.AsyncClient(
+            headers={
+                "Authorization": f"Bearer {config['api_key']}",
+                "Content-Type": "application/json",
+            },
+            timeout=httpx.Timeout(READ_TIMEOUT, connect=CONNECT_TIMEOUT, pool=POOL_TIMEOUT),
+            limits=httpx.Limits(max_connections=MAX_CONNECTIONS, max_keepalive_connections=MAX_KEEPALIVE),
+        )
+        _clients[provider] = client
+        logger.info("Transport pool created for provider=%s", provider)
+    return client
+
+
+def _semaphore(provider: str) -> asyncio.Semaphore:
+    sem = _in_flight.get(provider)
+    if sem is None:
+        sem = asyncio.Semaphore(MAX_IN_FLIGHT)
+        _in_flight[provider] = sem
+    return sem
+
+
+async def post_chat(provider: str, payload: dict) -> dict:
+    """
+    POST an OpenAI-compatible chat completion payload to `provider`.
+    Returns the decoded JSON body or raises ProviderError.
+    """
+    config = _provider_config(provider)
+    client = get_client(provider)
+    async with _semaphore(provider):
+        try:
+            response = await client.post(config["url"], json=payload)
+        except httpx.TimeoutException as e:
+            raise ProviderError(provider, f"Timed out: {e!r}") from e
+        except httpx.HTTPError as e:
+            raise ProviderError(provider, f"Transport error: {e!r}") from e
+
+    if response.status_code >= 400:
+        raise ProviderError(provider, response.text[:500], status_code=response.status_code)
+    try:
+        return response.json()
+    except ValueError as e:
+        raise ProviderError(provider, "Invalid JSON in response.", status_code=response.status_code) from e
+
+
+async def stream_chat(provider: str, payload: dict) -> AsyncIterator[str]:
+    """
+    POST `payload` with `stream=true` and yield content deltas as they arrive.
+    Providers answer with OpenAI-style SSE (`data: {...}` lines, `data: [DONE]`).
+    Raises ProviderError on transport/HTTP failures.
+    """
+    config = _provider_config(provider)
+    client = get_client(provider)
+    async with _semaphore(provider):
+        try:
+            async with client.stream("POST", config["url"], json={**payload, "stream": True}) as response:
+                if response.status_code >= 400:
+                    body = await response.aread()
+                    raise ProviderError(provider, body.decode(errors="replace")[:500], status_code=response.status_code)
+                async for line in response.aiter_lines():
+                    if not line.startswith("data:"):
+                        continue
+                    data = line[len("data:"):].strip()
+                    if data == "[DONE]":
+                        break
+                    try:
+                        chunk = json.loads(data)
+                    except ValueError:
+                        logger.debug("Skipping malformed stream chunk from %s: %r", provider, data[:200])
+                        continue
+                    choices = chunk.get("choices") or []
+                    delta = (choices[0].get("delta") or {}).get("content") if choices else None
+                    if delta:
+                        yield delta
+        except httpx.TimeoutException as e:
+            raise ProviderError(provider, f"Timed out: {e!r}") from e
+        except httpx.HTTPError as e:
+            raise ProviderError(provider, f"Transport error: {e!r}") from e
+
+
+def first_choice_content(result: dict) -> Optional[str]:
+    """Extract `choices[0].message.content` from a chat completion body."""
+    choices = result.get("choices") or []
+    if not choices:
+        return None
+    return (choices[0].get("message") or {}).get("content")
+
+
+async def aclose():
+    """Close every pooled client (called on application shutdown)."""
+    for provider, client in list(_clients.items()):
+        await client.aclose()
+        logger.info("Transport pool closed for provider=%s", provider)
+    _clients.clear()
+    _in_flight.clear()
@@ -4,10 +4,12 @@ from authlib.integrations.starlette_client import OAuth, OAuthError
 from fastapi import Request, APIRouter
 from fastapi.responses import RedirectResponse
 from fastapi import Depends
-from sqlmodel import Session
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
 
 from studio.core.config import settings
-from studio.services.db import get_session as get_db
+from studio.services.db import get_async_session as get_db
+from studio.services.models import User
 
 print(">>> LOADED: google.py <<<")
 load_dotenv()
@@ -28,7 +30,7 @@ async def login_via_google(request: Request):
     return await oauth.google.authorize_redirect(request, redirect_uri)
 
 @router.get("/google/callback")
-async def google_callback(request: Request, db: Session = Depends(get_db)):
+async def google_callback(request: Request, db: AsyncSession = Depends(get_db)):
     try:
         token = await oauth.google.authorize_access_token(request)
         user_info = await oauth.google.parse_id_token(request, token)
@@ -36,12 +38,12 @@ async def google_callback(request: Request, db: Session = Depends(get_db)):
         email = user_info.get("email")
 
         # Check if user exists
-        user = db.query(User).filter_by(email=email).first()
+        user = (await db.exec(select(User).where(User.email == email))).first()
         if not user:
             # Register new user
             user = User(email=email, name=user_info.get("name"))
             db.add(user)
-            db.commit()
+            await db.commit()
 
         # Set cookie, create session, etc.
         return RedirectResponse(url="/dashboard")
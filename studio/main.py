@@ -1,5 +1,4 @@
 import os
-import uuid
 from pathlib import Path
 from typing import Dict, List
 from starlette.requests import Request
@@ -9,23 +8,30 @@ from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from fastapi.responses import FileResponse
 from sqlmodel import Session, select
+from sqlmodel.ext.asyncio.session import AsyncSession
 from starlette.middleware.sessions import SessionMiddleware
 from starlette.middleware.base import BaseHTTPMiddleware
 from starlette.requests import Request as StarletteRequest
 from starlette.middleware import Middleware
-from docx import Document
 import uvicorn
 import logging
 
 # Chat & model handling
-from chat_client.generic_model_config import MODEL_REGISTRY, get_model_handler
+from chat_client.generic_model_config import MODEL_REGISTRY, get_model_handler, router_stats, inflight
+from chat_client import transport as llm_transport
+from chat_client.completion_cache import completion_cache
+from chat_client.semantic_cache import semantic_cache
 
 # App components
 from studio.routes import auth_routes, config_routes, chat_routes, newsdata_routes, project_and_settings_routes
-from studio.services.db import init_db, get_session
+from studio.services.db import init_db, get_session, get_async_session, dispose_engines
 from studio.dependency import get_current_user, require_roles
 from studio.services.config_manager import load_user_config_db, save_user_config_db
-from studio.services.db import get_user_sessions
+from studio.services.crud import list_conversation_summaries
+from studio.services.admission import admission
+from studio.services.persistence import turn_writer
+from studio.services.search import ensure_search_index
+from studio.services import news as news_service
 # from studio.settings import DEFAULT_USER_CONFIG 
 
 # Tool routes
@@ -33,7 +39,9 @@ from studio.auth import router as auth_router
 from tools.context_manager.context_management_routes import router as context_router
 from tools.RAG.rag_routes import router as rag_router
 from tools.MARKDOWN.md_routes import router as md_router
-from tools.DOCGEN.docgen_routes import router as docgen_router
+from tools.DOCGEN.docgen_routes import router as docgen_router, docx_response
+from tools.DOCGEN.generator import shutdown_pool
+from tools.MARKDOWN.render import markdown_renderer
 
 
 logging.basicConfig(
@@ -73,6 +81,7 @@ app.mount("/static", StaticFiles(directory="studio/static"), name="static")
 templates.env.cache.clear()
 
 init_db()
+ensure_search_index()
 
 # Include routers
 app.include_router(auth_routes.router, tags=["Authentication"])     # Need special alignment.
@@ -90,6 +99,22 @@ app.include_router(docgen_router, prefix="/tools/docgen")
     
 conversations_store: Dict[str, List[Dict[str, str]]] = {}  # {conversation_name: [ {"user":..., "ai":...}, ... ]}
 
+@app.on_event("startup")
+async def start_background_tasks():
+    logger.info(f"start_background_tasks\t- [initiated]")
+    turn_writer.start()
+    news_service.news_cache.start()
+
+@app.on_event("shutdown")
+async def shutdown_transport():
+    logger.info(f"shutdown_transport\t- [initiated]")
+    # Flush queued chat turns before the process goes away.
+    await turn_writer.close()
+    await llm_transport.aclose()
+    await news_service.aclose()
+    await dispose_engines()
+    shutdown_pool()
+
 @app.get("/favicon.ico")
 async def favicon():
     logger.info(f"favicon\t- [initiated]")
@@ -98,32 +123,23 @@ async def favicon():
 @app.post("/generate-doc")
 async def generate_doc(request: Request, content: str = Form(...)):
     logger.info(f"{__name__}\t- [initiated]")
-    doc = Document()
-    doc.add_heading("AI Response", level=1)
-    doc.add_paragraph(content)
-
-    filename = f"response_{uuid.uuid4().hex[:8]}.docx"
-    filepath = os.path.join(BASE_DIR, "generated", filename)
-    os.makedirs(os.path.dirname(filepath), exist_ok=True)
-    doc.save(filepath)
-
-    return FileResponse(path=filepath, filename=filename, media_type='application/vnd.openxmlformats-officedocument.wordprocessingml.document')
+    return await docx_response(content, "AI Response")
 
 
 @app.get("/", response_class=HTMLResponse)
-async def home(request: Request):
+async def home(request: Request, session: AsyncSession = Depends(get_async_session)):
     logger.info(f"{__name__}\t- [initiated]")
     user = request.state.user
     if user:
         logger.info(f"\n\nuser=>\n{user}\nid=>{user['id']}\n\n~~~~")
-        sessions = get_user_sessions(user['id'])  # fetch from DB
-        logger.info(f"\n\sessions=>\n{sessions}\n\n~~~~")
+        sessions, sessions_cursor = await list_conversation_summaries(session, user['id'])  # first sidebar page
         return templates.TemplateResponse(
             "index.html",
             {
                 "request": request,
                 "models": MODEL_REGISTRY,
                 "conversations": sessions,
+                "conversations_cursor": sessions_cursor,
             }
         )
     else:
@@ -155,7 +171,19 @@ def me(user = Depends(get_current_user)):
 @app.get("/admin/metrics")
 def metrics(user = Depends(require_roles("admin"))):
     logger.info(f"{__name__}\t- [initiated]")
-    return {"secret": "..." }
+    return {
+        "model_routes": router_stats(),
+        "completion_cache": completion_cache.stats(),
+        "semantic_cache": semantic_cache.stats(),
+        "inflight": inflight.stats(),
+        "admission": admission.stats(),
+        "persistence": turn_writer.stats(),
+        "markdown_cache": markdown_renderer.stats(),
+        "news_providers": news_service.news_stats(),
+        "news_images": news_service.image_stats(),
+        "news_cache": news_service.cache_stats(),
+        "news_feeds": news_service.feed_stats(),
+    }
 
 
 if __name__ == "__main__":
@@ -1,25 +1,36 @@
 from pathlib import Path
-from typing import Dict, List
+from typing import Callable, Dict, List
+import asyncio
+import json
+import os
 
 from fastapi import APIRouter, Depends, Form, Query, Request, HTTPException
 from fastapi.params import Body
-from fastapi.responses import FileResponse, HTMLResponse, RedirectResponse
+from fastapi.responses import HTMLResponse, RedirectResponse, StreamingResponse
 from fastapi.templating import Jinja2Templates
-from sqlmodel import Session
-from sqlalchemy.orm.attributes import flag_modified
+from sqlmodel.ext.asyncio.session import AsyncSession
 from datetime import datetime
 import logging
 
-from chat_client.generic_model_config import MODEL_REGISTRY, get_model_handler
-from studio.services.db import get_session
+from chat_client.generic_model_config import MODEL_REGISTRY, get_model_handler, get_model_stream_handler
+from chat_client.transport import ProviderError
+from studio.services.db import get_async_session
 from studio.services.crud import (
     create_conversation,
     get_conversation,
-    get_conversations_by_user,
+    list_conversation_summaries,
     update_conversation,
-    append_message
+    get_messages,
+    get_message_window,
+    delete_conversation,
 )
-from studio.services.models import Conversation
+from studio.services.models import Conversation, Message
+from studio.services.admission import admission, request_priority
+from studio.services.compaction import schedule_compaction
+from studio.services.persistence import turn_writer
+from studio.services.search import search_messages
+from studio.services.export import EXPORTERS, export_all_zip, export_conversation, export_filename
+from tools.MARKDOWN.render import render_markdown, render_message_html
 
 templates = Jinja2Templates(directory=str(Path(__file__).resolve().parent.parent / "templates"))
 
@@ -28,11 +39,24 @@ router = APIRouter()
 # DEFAULT_MODEL_ID = next(iter(MODEL_REGISTRY.keys()))
 DEFAULT_MODEL_ID = "mixtral"
 
+# Messages rendered with the conversation page; older ones are fetched on scroll.
+HISTORY_PAGE_SIZE = int(os.getenv("CHAT_HISTORY_PAGE_SIZE", "40"))
+SEARCH_PAGE_SIZE = int(os.getenv("CHAT_SEARCH_PAGE_SIZE", "20"))
+
 # very simple in‑memory store (move to Redis/DB later)
 conversations_store: Dict[str, List[Dict[str, str]]] = {}
 
 logger = logging.getLogger(__name__)
 
+def _message_views(messages: List[Message]) -> List[dict]:
+    """Template/JSON view of messages: `html` is the HTML stored at write time (rendered, cached, for older rows)."""
+    views = []
+    for m in messages:
+        view = m.to_dict()
+        view["html"] = m.content_html if m.content_html is not None else render_message_html(m.role, m.content)
+        views.append(view)
+    return views
+
 # ---------- NEW: /chat entry ----------
 @router.get("/", response_class=HTMLResponse)
 async def chat_entry(request: Request):
@@ -54,7 +78,7 @@ async def get_chat_view(
     request: Request,
     model_id: str,
     conversation_id: int = Query(default=None),
-    session_db: Session = Depends(get_session),
+    session_db: AsyncSession = Depends(get_async_session),
 ):
     logger.info(f'get_chat_view - Initiated')
     print(f"Model used: {model_id}")
@@ -63,11 +87,14 @@ async def get_chat_view(
     template = "chat_guest.html" if not user_id else "chat.html"
 
     conversation = None
+    window, history_before = [], None
     if user_id and conversation_id:
-        conversation = get_conversation(session_db, conversation_id, user_id)
-        print(f'retriving stored messages from conversation storage object==>{conversation.messages}')
+        await turn_writer.barrier(conversation_id)
+        conversation = await get_conversation(session_db, conversation_id, user_id)
+        if conversation:
+            window, history_before = await get_message_window(session_db, conversation.id, limit=HISTORY_PAGE_SIZE)
 
-    conversations_list = get_conversations_by_user(session_db, user_id) if user_id else []
+    conversations_list, conversations_cursor = await list_conversation_summaries(session_db, user_id) if user_id else ([], None)
 
     return templates.TemplateResponse(
         template,
@@ -77,9 +104,11 @@ async def get_chat_view(
             "DEFAULT_MODEL_ID": DEFAULT_MODEL_ID,
             "response": None,
             "user_input": None,
-            "conversation": conversation.messages if conversation else [],
+            "conversation": _message_views(window),
+            "history_before": history_before,
             "conversation_id": conversation.id if conversation else None,
             "conversations": conversations_list,
+            "conversations_cursor": conversations_cursor,
             "models": MODEL_REGISTRY,
         },
     )
@@ -90,11 +119,11 @@ async def get_chat_view(
 async def get_chat_view_model(
     request: Request,
     model_id: str,
-    session_db: Session = Depends(get_session),
+    session_db: AsyncSession = Depends(get_async_session),
 ):
     logger.info(f'get_chat_view_model - Initiated')
     user_id = request.session.get("user_id")
-    conversations_list = get_conversations_by_user(session_db, user_id) if user_id else []
+    conversations_list, conversations_cursor = await list_conversation_summaries(session_db, user_id) if user_id else ([], None)
     return templates.TemplateResponse(
         "chat.html" if user_id else "chat_guest.html",
         {
@@ -103,6 +132,7 @@ async def get_chat_view_model(
             "conversation": [],
             "conversation_id": None,
             "conversations": conversations_list,
+            "conversations_cursor": conversations_cursor,
             "models": MODEL_REGISTRY,
         },
     )
@@ -113,24 +143,88 @@ async def get_chat_view_model(
 async def get_chat_view_conversation(
     request: Request,
     conversation_id: int,
-    session_db: Session = Depends(get_session),
+    session_db: AsyncSession = Depends(get_async_session),
 ):
     logger.info(f'get_chat_view_conversation - Initiated')
     user_id = request.session.get("user_id")
-    conversation = get_conversation(session_db, conversation_id, user_id)
-    conversations_list = get_conversations_by_user(session_db, user_id) if user_id else []
+    await turn_writer.barrier(conversation_id)
+    conversation = await get_conversation(session_db, conversation_id, user_id)
+    window, history_before = (
+        await get_message_window(session_db, conversation.id, limit=HISTORY_PAGE_SIZE) if conversation else ([], None)
+    )
+    conversations_list, conversations_cursor = await list_conversation_summaries(session_db, user_id) if user_id else ([], None)
     return templates.TemplateResponse(
         "chat.html",
         {
             "request": request,
             "agent": DEFAULT_MODEL_ID,
-            "conversation": conversation.messages if conversation else [],
+            "conversation": _message_views(window),
+            "history_before": history_before,
             "conversation_id": conversation.id if conversation else None,
             "conversations": conversations_list,
+            "conversations_cursor": conversations_cursor,
             "models": MODEL_REGISTRY,
         },
     )
 
+# ---------- Older history pages ----------
+@router.get("/conversation/{conversation_id}/messages")
+async def get_conversation_messages(
+    request: Request,
+    conversation_id: int,
+    before: int | None = Query(default=None, ge=1),
+    limit: int = Query(default=HISTORY_PAGE_SIZE, ge=1, le=200),
+    session_db: AsyncSession = Depends(get_async_session),
+):
+    """Messages older than seq `before`, oldest first; `before` in the reply pages further back."""
+    user_id = request.session.get("user_id")
+    if not user_id:
+        raise HTTPException(status_code=403, detail="Login required")
+    await turn_writer.barrier(conversation_id)
+    if not await get_conversation(session_db, conversation_id, user_id):
+        raise HTTPException(status_code=404, detail="Conversation not found")
+    window, next_before = await get_message_window(session_db, conversation_id, before_seq=before, limit=limit)
+    return {"messages": _message_views(window), "before": next_before}
+
+# ---------- Sidebar pages ----------
+@router.get("/conversations")
+async def list_conversations(
+    request: Request,
+    cursor: str | None = Query(default=None),
+    limit: int = Query(default=50, ge=1, le=200),
+    session_db: AsyncSession = Depends(get_async_session),
+):
+    """Next page of the sidebar (id, name, updated_at), newest first."""
+    user_id = request.session.get("user_id")
+    if not user_id:
+        raise HTTPException(status_code=403, detail="Login required")
+    try:
+        page, next_cursor = await list_conversation_summaries(session_db, user_id, limit=limit, cursor=cursor)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return {
+        "conversations": [{"id": c.id, "name": c.name, "updated_at": c.updated_at.isoformat()} for c in page],
+        "next_cursor": next_cursor,
+    }
+
+# ---------- Search ----------
+@router.get("/search")
+async def search_conversations(
+    request: Request,
+    q: str = Query(..., min_length=1, max_length=200),
+    page: int = Query(default=1, ge=1),
+    session_db: AsyncSession = Depends(get_async_session),
+):
+    """Ranked full-text search over the user's messages, with highlighted snippets."""
+    user_id = request.session.get("user_id")
+    if not user_id:
+        raise HTTPException(status_code=403, detail="Login required")
+    await turn_writer.barrier_user(user_id)
+    hits, has_more = await search_messages(
+        session_db, user_id, q, limit=SEARCH_PAGE_SIZE, offset=(page - 1) * SEARCH_PAGE_SIZE
+    )
+    return {"query": q, "page": page, "results": hits, "next_page": page + 1 if has_more else None}
+
 # ---------- Guest chat ----------
 # @router.post("/public/send")
 # async def guest_chat_send(user_input: str = Form(...)):
@@ -163,29 +257,16 @@ async def guest_chat_send(user_input: str = Form(...)):
     handler = get_model_handler(DEFAULT_MODEL_ID)
     if not handler:
         return {"error": f"No handler found for model Default Model"}
-    ai_response = handler(user_input)
+    async with admission.admit(DEFAULT_MODEL_ID, request_priority(None)):
+        # Guest answers are shared, so this is the one path allowed to use the semantic cache.
+        ai_response = await handler(user_input, public=True)
     return {"user": user_input, "ai": ai_response}
 
 
 
 # ---------- Logged-in chat send ----------
-@router.post("/model/{model_id}/send")
-async def post_chat_message(
-    request: Request,
-    model_id: str,
-    user_input: str = Form(...),
-    conversation_id: int = Form(None),
-    session_db: Session = Depends(get_session),
-):
-    logger.info(f'post_chat_message - Initiated')
-    user_id = request.session.get("user_id")
-    if not user_id:
-        raise HTTPException(status_code=403, detail="Login required")
-
-    if model_id not in MODEL_REGISTRY:
-        raise HTTPException(status_code=400, detail=f"Invalid model id: {model_id}")
-
-    # Create new conversation if needed
+async def _resolve_conversation(request: Request, session_db: AsyncSession, user_id: int, user_input: str, conversation_id: int | None):
+    """Load the target conversation, or create one named from the form / first prompt."""
     if not conversation_id:
         form = await request.form()
         user_provided_name = form.get("conversation_name", "").strip()
@@ -198,29 +279,170 @@ async def post_chat_message(
                 # fallback to timestamp if empty
                 title = f"Chat {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
 
-        conv = create_conversation(session_db, user_id, name=title)
-        print(f'New conversation created into user object storage==>\t{conv.messages}')
+        conv = await create_conversation(session_db, user_id, name=title)
+        logger.info(f'New conversation {conv.id} created')
     else:
-        conv = get_conversation(session_db, conversation_id, user_id)
-        print(f'Retrived conversation from user object storage==>\t{conv.messages}')
+        # Turns from the previous send may still be queued; history must include them.
+        await turn_writer.barrier(conversation_id)
+        conv = await get_conversation(session_db, conversation_id, user_id)
         if not conv:
             raise HTTPException(status_code=404, detail="Conversation not found")
+    return conv
+
+
+@router.post("/model/{model_id}/send")
+async def post_chat_message(
+    request: Request,
+    model_id: str,
+    user_input: str = Form(...),
+    conversation_id: int = Form(None),
+    session_db: AsyncSession = Depends(get_async_session),
+):
+    logger.info(f'post_chat_message - Initiated')
+    user_id = request.session.get("user_id")
+    if not user_id:
+        raise HTTPException(status_code=403, detail="Login required")
+
+    if model_id not in MODEL_REGISTRY:
+        raise HTTPException(status_code=400, detail=f"Invalid model id: {model_id}")
+
+    conv = await _resolve_conversation(request, session_db, user_id, user_input, conversation_id)
 
     # Get AI response
     handler = get_model_handler(model_id)
-    ai_response = handler(user_input) if handler else "Error: No valid model handler"
-    
-    append_message(session_db, conv.id, user_id, "user", user_input)
-    append_message(session_db, conv.id, user_id, "assistant", ai_response)
+    async with admission.admit(model_id, request_priority(user_id)):
+        ai_response = await handler(
+            user_input, conv.system_prompt, conv.temperature,
+            history=[m.to_dict() for m in await get_messages(session_db, conv.id, after_seq=conv.summary_upto)],
+            summary=conv.summary,
+        ) if handler else "Error: No valid model handler"
+
+    # Token counts are filled in on the writer's thread, off the event loop.
+    turn_writer.submit(conv.id, user_id, [
+        ("user", user_input, None),
+        ("assistant", ai_response, None),
+    ], MODEL_REGISTRY[model_id])
+    schedule_compaction(conv.id, user_id, model_id)
+
+    html = await asyncio.to_thread(render_markdown, ai_response)
+    return {"user": user_input, "ai": ai_response, "html": html, "conversation_id": conv.id}
+
+# ---------- Logged-in chat stream (SSE) ----------
+class _ClosingStreamingResponse(StreamingResponse):
+    """StreamingResponse that calls `on_close` once it is done, even on disconnect (background tasks are skipped then)."""
+
+    def __init__(self, content, on_close: Callable[[], None], **kwargs):
+        super().__init__(content, **kwargs)
+        self._on_close = on_close
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self._on_close()
+
+def _sse(data: dict, event: str | None = None) -> str:
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data)}\n\n"
+
+@router.post("/model/{model_id}/stream")
+async def stream_chat_message(
+    request: Request,
+    model_id: str,
+    user_input: str = Form(...),
+    conversation_id: int = Form(None),
+    session_db: AsyncSession = Depends(get_async_session),
+):
+    """
+    Streaming variant of `/model/{model_id}/send`: forwards provider deltas as
+    Server-Sent Events. The turn is queued for persistence once, after the
+    stream completes or the client disconnects.
+    """
+    logger.info(f'stream_chat_message - Initiated')
+    user_id = request.session.get("user_id")
+    if not user_id:
+        raise HTTPException(status_code=403, detail="Login required")
 
-    return {"user": user_input, "ai": ai_response, "conversation_id": conv.id}
+    if model_id not in MODEL_REGISTRY:
+        raise HTTPException(status_code=400, detail=f"Invalid model id: {model_id}")
+
+    # Take the model slot before streaming starts so overload still surfaces as a plain 429.
+    granted_at = await admission.acquire(model_id, request_priority(user_id))
+    released = False
+    started = False
+
+    def release_slot():
+        nonlocal released
+        if not released:
+            released = True
+            admission.release(model_id, granted_at)
+
+    try:
+        conv = await _resolve_conversation(request, session_db, user_id, user_input, conversation_id)
+        conv_id = conv.id
+        system_prompt, temperature = conv.system_prompt, conv.temperature
+        history = [m.to_dict() for m in await get_messages(session_db, conv_id, after_seq=conv.summary_upto)]
+        summary = conv.summary
+        model_config = MODEL_REGISTRY[model_id]
+        stream_handler = get_model_stream_handler(model_id)
+    except BaseException:
+        release_slot()
+        raise
+
+    def queue_turn(ai_response: str, status: str):
+        turn = [("user", user_input, None)]
+        if ai_response:
+            turn.append(("assistant", ai_response, None))
+        turn_writer.submit(conv_id, user_id, turn, model_config)
+        schedule_compaction(conv_id, user_id, model_id)
+        logger.info(f'stream_chat_message - queued ({status}) for conversation {conv_id}')
+
+    async def event_stream():
+        nonlocal started
+        started = True
+        parts: List[str] = []
+        status = "done"
+        try:
+            yield _sse({"conversation_id": conv_id}, event="meta")
+            async for delta in stream_handler(user_input, system_prompt, temperature, history=history, summary=summary):
+                parts.append(delta)
+                yield _sse({"delta": delta})
+            # Rendered here once; the persisted turn reuses it from the render cache.
+            html = await asyncio.to_thread(render_markdown, "".join(parts))
+            yield _sse({"conversation_id": conv_id, "html": html}, event="done")
+        except ProviderError as e:
+            status = "error"
+            logger.warning("Stream failed for %s: %s", model_id, e)
+            yield _sse({"error": "⚠️ No response received from the model."}, event="error")
+        except (asyncio.CancelledError, GeneratorExit):
+            status = "aborted"
+            raise
+        finally:
+            release_slot()
+            ai_response = "".join(parts)
+            if not ai_response and status == "error":
+                ai_response = "⚠️ No response received from the model."
+            queue_turn(ai_response, status)
+
+    def on_close():
+        # Runs however the response ends; covers a client gone before the body was first iterated.
+        release_slot()
+        if not started:
+            queue_turn("", "aborted")
+
+    return _ClosingStreamingResponse(
+        event_stream(),
+        on_close=on_close,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 # ---------- Save system prompt ----------
 @router.post("/save_system_prompt")
 async def save_system_prompt(
     request: Request,
     data: dict = Body(...),
-    session_db: Session = Depends(get_session)
+    session_db: AsyncSession = Depends(get_async_session)
 ):
     logger.info(f'save_system_prompt - Initiated')
     user_id = request.session.get("user_id")
@@ -228,43 +450,54 @@ async def save_system_prompt(
     prompt = data.get("prompt")
     logger.info(f'Passed data=>\nuser_id=> {user_id}\nconversation_id=> {conversation_id}\nprompt=> {prompt}')
 
-    conv = get_conversation(session_db, conversation_id, user_id)
+    conv = await get_conversation(session_db, conversation_id, user_id)
     logger.info(f'get_conversation - Accessed to retrive an existing conversation- {conversation_id} \nfrom user object storage: {session_db}')
     if not conv:
         raise HTTPException(status_code=404, detail="Conversation not found")
 
-    update_conversation(session_db, conv, system_prompt=prompt)
+    conv.system_prompt = prompt
+    await update_conversation(session_db, conv)
     return {"status": "success", "saved_prompt": prompt}
 
 # ---------- Export session ----------
 @router.get("/export_session/{conversation_id}.{fmt}")
-def export_session(
+async def export_session(
     request: Request,
     conversation_id: int,
     fmt: str,
-    session_db: Session = Depends(get_session)
+    session_db: AsyncSession = Depends(get_async_session)
 ):
     logger.info(f'export_session - Initiated')
     user_id = request.session.get("user_id")
-    conv = get_conversation(session_db, conversation_id, user_id)
+    if fmt not in EXPORTERS:
+        raise HTTPException(status_code=400, detail="Unsupported format")
+    await turn_writer.barrier(conversation_id)
+    conv = await get_conversation(session_db, conversation_id, user_id)
     if not conv:
         raise HTTPException(status_code=404, detail="Conversation not found")
 
-    if fmt == "md":
-        logger.info(f'fmt == "md')
-        content = "\n\n".join(
-            f"**{m['role'].capitalize()}**: {m['content']}" for m in conv.messages
-        )
-        file_path = f"/tmp/chat_{conversation_id}.md"
-        Path(file_path).write_text(content)
-        return FileResponse(file_path, filename=f"conversation_{conversation_id}.md")
-
-    elif fmt == "pdf":
-        logger.info(f'fmt == "pdf')
-        # Generate PDF here
-        ...
+    filename = export_filename(conv.id, conv.name, fmt)
+    return StreamingResponse(
+        export_conversation(conv, fmt),
+        media_type=EXPORTERS[fmt][1],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
 
-    raise HTTPException(status_code=400, detail="Unsupported format")
+@router.get("/export_all.zip")
+async def export_all_sessions(request: Request, fmt: str = Query(default="md")):
+    """Every conversation of the user, one file each, streamed as a zip."""
+    logger.info(f'export_all_sessions - Initiated')
+    user_id = request.session.get("user_id")
+    if not user_id:
+        raise HTTPException(status_code=403, detail="Login required")
+    if fmt not in EXPORTERS:
+        raise HTTPException(status_code=400, detail="Unsupported format")
+    await turn_writer.barrier_user(user_id)
+    return StreamingResponse(
+        export_all_zip(user_id, fmt),
+        media_type="application/zip",
+        headers={"Content-Disposition": f'attachment; filename="conversations_{fmt}.zip"'},
+    )
 
 
 # ---------- Delete conversation ----------
@@ -272,19 +505,16 @@ def export_session(
 async def delete_conversation_route(
     request: Request,
     conversation_id: int,
-    session_db: Session = Depends(get_session),
+    session_db: AsyncSession = Depends(get_async_session),
 ):
     logger.info(f'delete_conversation_route - Initiated for {conversation_id}')
     user_id = request.session.get("user_id")
     if not user_id:
         raise HTTPException(status_code=403, detail="Login required")
 
-    conv = get_conversation(session_db, conversation_id, user_id)
-    if not conv:
+    await turn_writer.barrier(conversation_id)
+    if not await delete_conversation(session_db, conversation_id, user_id):
         raise HTTPException(status_code=404, detail="Conversation not found")
-
-    session_db.delete(conv)
-    session_db.commit()
     logger.info(f'Conversation {conversation_id} deleted for user {user_id}')
 
     # 👇 redirect to a new chat session with your default agent
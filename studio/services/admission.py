@@ -0,0 +1,196 @@
+"""
+Per-model admission control for chat completions.
+
+Every model id in MODEL_REGISTRY gets a gate with a concurrency limit and a
+bounded priority queue. Authenticated users queue ahead of guests; each
+waiter has a deadline, and requests that cannot be served in time (queue
+full, or estimated wait past the deadline) fail fast with 429 + Retry-After.
+"""
+import asyncio
+import bisect
+import itertools
+import math
+import os
+import time
+import logging
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Dict, List, Optional
+
+from fastapi import HTTPException, status
+
+from chat_client.generic_model_config import MODEL_REGISTRY
+
+logger = logging.getLogger(__name__)
+
+PRIORITY_AUTHENTICATED = 0
+PRIORITY_GUEST = 1
+
+DEFAULT_MAX_CONCURRENCY = int(os.getenv("ADMISSION_MAX_CONCURRENCY", "16"))
+DEFAULT_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", "64"))
+QUEUE_TIMEOUTS = {
+    PRIORITY_AUTHENTICATED: float(os.getenv("ADMISSION_QUEUE_TIMEOUT_AUTH", "30")),
+    PRIORITY_GUEST: float(os.getenv("ADMISSION_QUEUE_TIMEOUT_GUEST", "10")),
+}
+
+
+class AdmissionRejected(HTTPException):
+    def __init__(self, model_id: str, retry_after: float, reason: str):
+        super().__init__(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=f"Model {model_id} is busy ({reason}). Please retry shortly.",
+            headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+        )
+
+
+class _Waiter:
+    __slots__ = ("priority", "seq", "deadline", "future")
+
+    def __init__(self, priority: int, seq: int, deadline: float, future: asyncio.Future):
+        self.priority = priority
+        self.seq = seq
+        self.deadline = deadline
+        self.future = future
+
+    def __lt__(self, other: "_Waiter"):
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class ModelGate:
+    def __init__(self, model_id: str, max_concurrency: int, max_queue: int):
+        self.model_id = model_id
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.active = 0
+        self._queue: List[_Waiter] = []          # sorted: best priority first, FIFO within a class
+        self._seq = itertools.count()
+        self.avg_service_s = 2.0                 # EWMA of slot hold time, seeds the wait estimate
+        self.admitted = 0
+        self.rejected = 0
+        self.waits = deque(maxlen=500)
+
+    # ---------- Estimates ----------
+    def _estimated_wait(self, ahead: int) -> float:
+        return (ahead // self.max_concurrency + 1) * self.avg_service_s
+
+    # ---------- Queue ops ----------
+    def _remove(self, waiter: _Waiter):
+        index = bisect.bisect_left(self._queue, waiter)
+        if index < len(self._queue) and self._queue[index] is waiter:
+            self._queue.pop(index)
+
+    def _reject(self, reason: str, retry_after: float):
+        self.rejected += 1
+        logger.warning("Admission rejected for %s: %s (retry after %.1fs)", self.model_id, reason, retry_after)
+        return AdmissionRejected(self.model_id, retry_after, reason)
+
+    async def acquire(self, priority: int) -> float:
+        """Wait for a slot; returns the grant time to pass back to `release`."""
+        enqueued = time.monotonic()
+        if self.active < self.max_concurrency and not self._queue:
+            self.active += 1
+            self._record(enqueued)
+            return time.monotonic()
+
+        timeout = QUEUE_TIMEOUTS.get(priority, QUEUE_TIMEOUTS[PRIORITY_GUEST])
+        waiter = _Waiter(priority, next(self._seq), enqueued + timeout, asyncio.get_running_loop().create_future())
+        ahead = bisect.bisect_left(self._queue, waiter)
+
+        if len(self._queue) >= self.max_queue:
+            worst = self._queue[-1]
+            if worst.priority <= priority:
+                raise self._reject("queue full", self._estimated_wait(len(self._queue)))
+            # Make room for a higher-priority request by shedding the newest low-priority waiter.
+            self._queue.pop()
+            worst.future.set_exception(self._reject("preempted", self._estimated_wait(len(self._queue))))
+
+        estimate = self._estimated_wait(ahead)
+        if estimate > timeout:
+            raise self._reject("estimated wait exceeds deadline", estimate)
+
+        bisect.insort(self._queue, waiter)
+        try:
+            await asyncio.wait_for(waiter.future, timeout=waiter.deadline - time.monotonic())
+        except asyncio.TimeoutError:
+            self._remove(waiter)
+            raise self._reject("queue deadline passed", self._estimated_wait(len(self._queue)))
+        except asyncio.CancelledError:
+            if waiter.future.done() and not waiter.future.cancelled() and waiter.future.exception() is None:
+                # Slot was granted just as the caller went away; hand it on.
+                self.release(time.monotonic())
+            else:
+                self._remove(waiter)
+            raise
+        self._record(enqueued)
+        return time.monotonic()
+
+    def release(self, granted_at: float):
+        held = time.monotonic() - granted_at
+        self.avg_service_s = 0.8 * self.avg_service_s + 0.2 * held
+        self.active -= 1
+        now = time.monotonic()
+        while self._queue and self.active < self.max_concurrency:
+            waiter = self._queue.pop(0)
+            if waiter.future.done() or waiter.deadline < now:
+                continue
+            self.active += 1
+            waiter.future.set_result(True)
+
+    def _record(self, enqueued: float):
+        self.admitted += 1
+        self.waits.append(time.monotonic() - enqueued)
+
+    def stats(self) -> dict:
+        waits = sorted(self.waits)
+        return {
+            "active": self.active,
+            "queued": len(self._queue),
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "avg_service_s": round(self.avg_service_s, 3),
+            "wait_avg_s": round(sum(waits) / len(waits), 4) if waits else 0.0,
+            "wait_p95_s": round(waits[int(0.95 * (len(waits) - 1))], 4) if waits else 0.0,
+        }
+
+
+class AdmissionController:
+    def __init__(self):
+        self._gates: Dict[str, ModelGate] = {}
+
+    def gate(self, model_id: str) -> ModelGate:
+        gate = self._gates.get(model_id)
+        if gate is None:
+            model_config = MODEL_REGISTRY.get(model_id, {})
+            gate = ModelGate(
+                model_id,
+                max_concurrency=model_config.get("max_concurrency", DEFAULT_MAX_CONCURRENCY),
+                max_queue=model_config.get("max_queue", DEFAULT_MAX_QUEUE),
+            )
+            self._gates[model_id] = gate
+        return gate
+
+    async def acquire(self, model_id: str, priority: int) -> float:
+        return await self.gate(model_id).acquire(priority)
+
+    def release(self, model_id: str, granted_at: float):
+        self.gate(model_id).release(granted_at)
+
+    @asynccontextmanager
+    async def admit(self, model_id: str, priority: int):
+        granted_at = await self.acquire(model_id, priority)
+        try:
+            yield
+        finally:
+            self.release(model_id, granted_at)
+
+    def stats(self) -> dict:
+        return {model_id: gate.stats() for model_id, gate in self._gates.items()}
+
+
+admission = AdmissionController()
+
+
+def request_priority(user_id: Optional[int]) -> int:
+    return PRIORITY_AUTHENTICATED if user_id else PRIORITY_GUEST
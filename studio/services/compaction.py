@@ -0,0 +1,157 @@
+"""
+Rolling summarization of long conversations.
+
+Once the part of a conversation not yet covered by its summary grows past
+COMPACT_TRIGGER_TOKENS, a background task folds those turns into the stored
+summary (old summary + new turns -> new summary), leaving the most recent
+turns verbatim. Turns are folded in chunks that fit the summary model's
+window next to the current summary, and `summary_upto` only ever advances
+past turns that were actually in a summary prompt. The send path then
+replays summary + uncovered turns instead of the full prefix.
+"""
+import asyncio
+import os
+import logging
+from typing import Dict, List, Tuple
+
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from chat_client.context_builder import (
+    DEFAULT_CONTEXT_WINDOW, DEFAULT_MAX_OUTPUT_TOKENS, MESSAGE_OVERHEAD_TOKENS, MIN_TRUNCATED_TOKENS,
+    get_token_counter,
+)
+from chat_client.generic_model_config import MODEL_REGISTRY, get_model_router
+from chat_client.transport import ProviderError
+from studio.services.db import async_engine
+from studio.services.crud import get_conversation, get_messages, update_conversation_summary
+from studio.services.persistence import turn_writer
+
+logger = logging.getLogger(__name__)
+
+COMPACT_TRIGGER_TOKENS = int(os.getenv("CONVERSATION_COMPACT_TOKENS", "2048"))
+COMPACT_KEEP_RECENT = int(os.getenv("CONVERSATION_COMPACT_KEEP_RECENT", "6"))
+SUMMARY_MODEL_ID = os.getenv("CONVERSATION_SUMMARY_MODEL", "mixtral")
+SUMMARY_TEMPERATURE = 0.2
+
+SUMMARY_SYSTEM_PROMPT = (
+    "You maintain a running summary of a chat between a user and an AI assistant. "
+    "Merge the new turns into the existing summary. Keep facts, decisions, names, numbers, "
+    "open questions and user preferences; drop pleasantries. Reply with the updated summary only."
+)
+
+SUMMARY_PROMPT = "Existing summary:\n{summary}\n\nNew turns:\n{turns}"
+TURN_SEPARATOR_TOKENS = 2
+
+_running: Dict[int, asyncio.Task] = {}
+
+
+def _render_turn(message: dict) -> str:
+    return f"{message['role'].upper()}: {message['content']}"
+
+
+def _next_chunk(model_config: dict, summary: str, turns: List[dict]) -> Tuple[List[dict], str]:
+    """
+    The leading `turns` that fit the summary model's window next to `summary`,
+    and the prompt folding them in. Blocking (tokenizer); run in a thread.
+    """
+    counter = get_token_counter(model_config)
+    summary = summary or "(none yet)"
+    budget = (
+        model_config.get("context_window", DEFAULT_CONTEXT_WINDOW)
+        - model_config.get("max_output_tokens", DEFAULT_MAX_OUTPUT_TOKENS)
+        - counter.count(SUMMARY_SYSTEM_PROMPT)
+        - counter.count(SUMMARY_PROMPT.format(summary=summary, turns=""))
+        - 2 * MESSAGE_OVERHEAD_TOKENS
+    )
+    chunk, rendered = [], []
+    for turn in turns:
+        text = _render_turn(turn)
+        needed = counter.count(text) + TURN_SEPARATOR_TOKENS
+        if needed > budget:
+            if not chunk:
+                # One turn larger than the whole window: summarize its most recent part.
+                logger.warning(f"[compaction] message {turn['seq']} exceeds the summary window; truncating it")
+                chunk.append(turn)
+                rendered.append(counter.truncate_tail(text, max(budget - TURN_SEPARATOR_TOKENS, MIN_TRUNCATED_TOKENS)))
+            break
+        chunk.append(turn)
+        rendered.append(text)
+        budget -= needed
+    return chunk, SUMMARY_PROMPT.format(summary=summary, turns="\n\n".join(rendered))
+
+
+async def _load(conversation_id: int, user_id: int):
+    async with AsyncSession(async_engine, expire_on_commit=False) as db:
+        conv = await get_conversation(db, conversation_id, user_id)
+        if not conv:
+            return None
+        messages = await get_messages(db, conversation_id, after_seq=conv.summary_upto)
+        return conv.summary, conv.summary_upto, [m.to_dict() for m in messages]
+
+
+async def _save(conversation_id: int, user_id: int, summary: str, upto: int, tokens: int):
+    async with AsyncSession(async_engine, expire_on_commit=False) as db:
+        await update_conversation_summary(db, conversation_id, user_id, summary, upto, tokens)
+
+
+async def compact_conversation(conversation_id: int, user_id: int, model_id: str):
+    """Fold uncovered turns into the rolling summary if they exceed the trigger size."""
+    await turn_writer.barrier(conversation_id)
+    loaded = await _load(conversation_id, user_id)
+    if loaded is None:
+        return
+    summary, summary_upto, uncovered = loaded
+
+    if len(uncovered) <= COMPACT_KEEP_RECENT:
+        return
+    counter = get_token_counter(MODEL_REGISTRY.get(model_id, {}))
+    uncovered_tokens = await asyncio.to_thread(lambda: sum(counter.message_tokens(m) for m in uncovered))
+    if uncovered_tokens < COMPACT_TRIGGER_TOKENS:
+        return
+    to_fold = uncovered[:-COMPACT_KEEP_RECENT]
+    summary_config = MODEL_REGISTRY[SUMMARY_MODEL_ID]
+
+    while to_fold:
+        chunk, prompt = await asyncio.to_thread(_next_chunk, summary_config, summary, to_fold)
+        # Straight to the router: summaries are per-conversation, so the response caches must not serve them.
+        summary_messages = [
+            {"role": "system", "content": SUMMARY_SYSTEM_PROMPT},
+            {"role": "user", "content": prompt},
+        ]
+        try:
+            new_summary = await get_model_router(SUMMARY_MODEL_ID).complete(
+                lambda provider_model_id: {
+                    "model": provider_model_id,
+                    "messages": summary_messages,
+                    "temperature": SUMMARY_TEMPERATURE,
+                    "max_tokens": summary_config.get("max_output_tokens", DEFAULT_MAX_OUTPUT_TOKENS),
+                }
+            )
+        except ProviderError as e:
+            logger.warning(f"[compaction] summary failed for conversation {conversation_id}: {e}; keeping previous summary")
+            return
+
+        # Saved per chunk: the summary covers exactly the turns that were in the prompt.
+        new_upto = chunk[-1]["seq"]
+        tokens = await asyncio.to_thread(counter.count, new_summary)
+        await _save(conversation_id, user_id, new_summary, new_upto, tokens)
+        logger.info(f"[compaction] conversation {conversation_id} summarized up to message {new_upto}")
+        summary = new_summary
+        to_fold = to_fold[len(chunk):]
+
+
+def schedule_compaction(conversation_id: int, user_id: int, model_id: str):
+    """Start compaction in the background unless one is already running for this conversation."""
+    task = _running.get(conversation_id)
+    if task is not None and not task.done():
+        return
+    task = asyncio.get_running_loop().create_task(compact_conversation(conversation_id, user_id, model_id))
+    _running[conversation_id] = task
+
+    def _done(t: asyncio.Task):
+        if _running.get(conversation_id) is t:
+            del _running[conversation_id]
+        if not t.cancelled() and t.exception() is not None:
+            logger.error(f"[compaction] conversation {conversation_id} failed: {t.exception()!r}")
+
+    task.add_done_callback(_done)
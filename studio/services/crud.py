@@ -1,15 +1,18 @@
 from sqlmodel import select, Session
 from passlib.hash import bcrypt
 from studio.services.models import User, UserConfig
-from sqlalchemy.orm import Session
-from sqlalchemy.orm.attributes import flag_modified
-from typing import List, Optional
+from sqlalchemy import Integer, String, and_, delete, func, insert, literal, or_, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import defer
+from sqlmodel.ext.asyncio.session import AsyncSession
+from typing import List, Optional, Tuple
 from datetime import datetime, timezone
 import logging
 
 from studio.services.models import User, UserConfig
 from studio.services.security import hash_password, verify_password
-from studio.services.models import Conversation
+from studio.services.models import Conversation, ConversationSummary, Message
+from tools.MARKDOWN.render import render_message_html
 
 logger = logging.getLogger(__name__)
 
@@ -53,66 +56,182 @@ def set_user_config(session: Session, user_id: int, data: dict):
     session.refresh(cfg)
     return cfg.data
 
-def create_conversation(db: Session, user_id: int, name: str):
+# ---------- Conversations & messages (async) ----------
+async def create_conversation(db: AsyncSession, user_id: int, name: str):
     logger.info('\nDefined [create_conversation] is initiated ')
     if not name:
         name = "New Conversation"
     convo = Conversation(user_id=user_id, name=name)
     db.add(convo)
-    db.commit()
-    db.refresh(convo)
+    await db.commit()
+    await db.refresh(convo)
     return convo
 
-def get_conversations_by_user(db: Session, user_id: int) -> List[Conversation]:
-    logger.info('\nDefined [get_conversations_by_user] is initiated ')
-    return db.query(Conversation).filter(Conversation.user_id == user_id).order_by(Conversation.updated_at.desc()).all()
-
-def get_conversation(db: Session, convo_id: int, user_id: int) -> Optional[Conversation]:
+def encode_conversation_cursor(summary: ConversationSummary) -> str:
+    return f"{summary.updated_at.isoformat()}_{summary.id}"
+
+def decode_conversation_cursor(cursor: str) -> Tuple[datetime, int]:
+    """Inverse of encode_conversation_cursor; raises ValueError on malformed input."""
+    updated_at, _, convo_id = cursor.rpartition("_")
+    return datetime.fromisoformat(updated_at), int(convo_id)
+
+async def list_conversation_summaries(db: AsyncSession, user_id: int, limit: int = 50,
+                                      cursor: Optional[str] = None) -> Tuple[List[ConversationSummary], Optional[str]]:
+    """
+    One sidebar page, newest first: only id, name and updated_at are selected
+    and rows are keyset-paginated on (updated_at, id) using the
+    (user_id, updated_at, id) index. Returns (page, cursor for the next page or None).
+    """
+    logger.info('\nDefined [list_conversation_summaries] is initiated ')
+    stmt = (
+        select(Conversation.id, Conversation.name, Conversation.updated_at)
+        .where(Conversation.user_id == user_id)
+        .order_by(Conversation.updated_at.desc(), Conversation.id.desc())
+        .limit(limit + 1)
+    )
+    if cursor:
+        updated_at, convo_id = decode_conversation_cursor(cursor)
+        stmt = stmt.where(or_(
+            Conversation.updated_at < updated_at,
+            and_(Conversation.updated_at == updated_at, Conversation.id < convo_id),
+        ))
+    rows = [ConversationSummary(id=r.id, name=r.name, updated_at=r.updated_at) for r in await db.exec(stmt)]
+    next_cursor = encode_conversation_cursor(rows[limit - 1]) if len(rows) > limit else None
+    return rows[:limit], next_cursor
+
+async def get_conversation(db: AsyncSession, convo_id: int, user_id: int) -> Optional[Conversation]:
     logger.info('\nDefined [get_conversation] is initiated ')
-    return db.query(Conversation).filter(
+    stmt = select(Conversation).options(defer(Conversation.messages)).where(
         Conversation.id == convo_id, Conversation.user_id == user_id
-    ).first()
-
- 
+    )
+    return (await db.exec(stmt)).first()
 
-def update_conversation_settings(db: Session, convo_id: int, user_id: int, system_prompt: str, temperature: float):
+async def update_conversation_settings(db: AsyncSession, convo_id: int, user_id: int, system_prompt: str, temperature: float):
     logger.info('\nDefined [update_conversation_settings] is initiated ')
-    convo = get_conversation(db, convo_id, user_id)
+    convo = await get_conversation(db, convo_id, user_id)
     if convo:
         convo.system_prompt = system_prompt
         convo.temperature = temperature
         convo.updated_at = datetime.now(timezone.utc)
-        db.commit()
+        await db.commit()
         return convo
     return None
 
-def append_message(db: Session, convo_id: int, user_id: int, role: str, content: str):
+async def _insert_message(db: AsyncSession, convo_id: int, user_id: int, role: str, content: str, tokens: dict | None, now: datetime):
+    """INSERT ... SELECT one message; the next seq and the ownership check are resolved inside the statement."""
+    tokenizer, token_count = next(iter(tokens.items())) if tokens else (None, None)
+    # Correlated max(seq): one backwards probe of ix_message_conversation_seq, whatever the conversation length.
+    next_seq = (
+        select(func.coalesce(func.max(Message.seq), 0) + 1)
+        .where(Message.conversation_id == Conversation.id)
+        .scalar_subquery()
+    )
+    source = select(
+        Conversation.id, next_seq, literal(role), literal(content), literal(render_message_html(role, content), String),
+        literal(token_count, Integer), literal(tokenizer, String), literal(now), literal(now),
+    ).where(Conversation.id == convo_id, Conversation.user_id == user_id)
+    stmt = insert(Message).from_select(
+        ["conversation_id", "seq", "role", "content", "content_html", "token_count", "tokenizer", "created_at", "updated_at"],
+        source,
+    ).returning(Message.seq)
+    return (await db.exec(stmt)).scalar()
+
+async def append_message(db: AsyncSession, convo_id: int, user_id: int, role: str, content: str, tokens: dict | None = None):
+    """
+    Append one message in its own transaction. Returns the new seq, or None
+    when the conversation does not belong to the user.
+    """
     logger.info('\nDefined [append_message] is initiated ')
-    convo = get_conversation(db, convo_id, user_id)
-    if convo:
-        convo.messages.append({"role": role, "content": content})
-        flag_modified(convo, "messages")
-        convo.updated_at = datetime.now(timezone.utc)
-        db.commit()
-        db.refresh(convo)
-        print(f"[DEBUG] Messages after append: {convo.messages}")  # debugging
+    for attempt in range(3):
+        now = datetime.now(timezone.utc)
+        try:
+            seq = await _insert_message(db, convo_id, user_id, role, content, tokens, now)
+            if seq is None:
+                await db.rollback()
+                return None
+            await db.exec(update(Conversation).where(Conversation.id == convo_id).values(updated_at=now))
+            await db.commit()
+            return seq
+        except IntegrityError:
+            # Concurrent append took the same seq (possible on Postgres); recompute and retry.
+            await db.rollback()
+            if attempt == 2:
+                raise
+
+async def append_turns(db: AsyncSession, turns: List[dict]) -> int:
+    """
+    Write several turns in one transaction (group commit). Each turn is
+    {"conversation_id", "user_id", "messages": [(role, content, tokens), ...]}.
+    Returns the number of messages written.
+    """
+    logger.info('\nDefined [append_turns] is initiated ')
+    for attempt in range(3):
+        now = datetime.now(timezone.utc)
+        written = 0
+        try:
+            touched = set()
+            for turn in turns:
+                for role, content, tokens in turn["messages"]:
+                    if await _insert_message(db, turn["conversation_id"], turn["user_id"], role, content, tokens, now) is not None:
+                        written += 1
+                        touched.add(turn["conversation_id"])
+            if touched:
+                await db.exec(update(Conversation).where(Conversation.id.in_(touched)).values(updated_at=now))
+            await db.commit()
+            return written
+        except IntegrityError:
+            await db.rollback()
+            if attempt == 2:
+                raise
+
+async def get_messages(db: AsyncSession, convo_id: int, after_seq: int = 0, limit: Optional[int] = None) -> List[Message]:
+    logger.info('\nDefined [get_messages] is initiated ')
+    stmt = select(Message).where(Message.conversation_id == convo_id, Message.seq > after_seq).order_by(Message.seq)
+    if limit is not None:
+        stmt = stmt.limit(limit)
+    return list(await db.exec(stmt))
+
+async def get_message_window(db: AsyncSession, convo_id: int, before_seq: Optional[int] = None,
+                             limit: int = 40) -> Tuple[List[Message], Optional[int]]:
+    """
+    The newest `limit` messages with seq < before_seq (all, when None), in
+    chat order. Returns (messages, before_seq for the next older page or None).
+    """
+    logger.info('\nDefined [get_message_window] is initiated ')
+    stmt = select(Message).where(Message.conversation_id == convo_id)
+    if before_seq is not None:
+        stmt = stmt.where(Message.seq < before_seq)
+    stmt = stmt.order_by(Message.seq.desc()).limit(limit + 1)
+    rows = list(await db.exec(stmt))
+    page = rows[:limit]
+    page.reverse()
+    return page, (page[0].seq if len(rows) > limit else None)
+
+async def update_conversation_summary(db: AsyncSession, convo_id: int, user_id: int, summary: str, summary_upto: int, summary_tokens: int):
+    logger.info('\nDefined [update_conversation_summary] is initiated ')
+    convo = await get_conversation(db, convo_id, user_id)
+    if convo and summary_upto > convo.summary_upto:
+        convo.summary = summary
+        convo.summary_upto = summary_upto
+        convo.summary_tokens = summary_tokens
+        await db.commit()
         return convo
     return None
 
-def update_conversation(db: Session, convo: Conversation):
+async def update_conversation(db: AsyncSession, convo: Conversation):
     logger.info('\nDefined [update_conversation] is initiated ')
     convo.updated_at = datetime.now(timezone.utc)
     db.add(convo)
-    db.commit()
-    db.refresh(convo)
+    await db.commit()
+    await db.refresh(convo)
     return convo
 
-def delete_conversation(db: Session, convo_id: int, user_id: int):
+async def delete_conversation(db: AsyncSession, convo_id: int, user_id: int):
     logger.info('\nDefined [delete_conversation] is initiated ')
-    convo = get_conversation(db, convo_id, user_id)
+    convo = await get_conversation(db, convo_id, user_id)
     if not convo:
         return None
-    db.delete(convo)
-    db.commit()
+    await db.exec(delete(Message).where(Message.conversation_id == convo_id))
+    await db.delete(convo)
+    await db.commit()
     return True
-
@@ -1,27 +1,209 @@
 from sqlmodel import SQLModel, create_engine, Session, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlalchemy import Text, cast, event, inspect, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine
 import os
 import logging
-from .models import Conversation
+from .models import Conversation, Message
+from tools.MARKDOWN.render import render_message_html
 
 DB_URL = os.getenv("DB_URL", "sqlite:///./studio.db")
-engine = create_engine(DB_URL, connect_args={"check_same_thread": False})
+
+# SQLite profile
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+SQLITE_CACHE_SIZE_KB = int(os.getenv("SQLITE_CACHE_SIZE_KB", "65536"))
+
+# Postgres pools (per engine; the sync engine only serves startup and threadpool routes)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+
+# DB_URL may name a sync or an async driver; each engine gets its counterpart
+# (psycopg 3 serves both sides on Postgres).
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "sqlite+pysqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+psycopg",
+    "postgresql+psycopg2": "postgresql+psycopg",
+}
+SYNC_DRIVERS = {
+    "sqlite+aiosqlite": "sqlite",
+    "postgresql": "postgresql+psycopg",
+    "postgresql+asyncpg": "postgresql+psycopg",
+}
 
 logger = logging.getLogger(__name__)
 
+def _is_sqlite(url) -> bool:
+    return url.get_backend_name() == "sqlite"
+
+def _async_url(url):
+    return url.set(drivername=ASYNC_DRIVERS.get(url.drivername, url.drivername))
+
+def _sync_url(url):
+    return url.set(drivername=SYNC_DRIVERS.get(url.drivername, url.drivername))
+
+def _engine_kwargs(url) -> dict:
+    if _is_sqlite(url):
+        return {"connect_args": {"check_same_thread": False}}
+    return {
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": True,
+    }
+
+def _apply_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    # WAL: readers no longer block the writer; NORMAL sync is durable across app crashes in WAL mode.
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+    cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+    cursor.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_SIZE_KB}")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.close()
+
+_url = make_url(DB_URL)
+engine = create_engine(_sync_url(_url), **_engine_kwargs(_url))
+async_engine = create_async_engine(_async_url(_url), **_engine_kwargs(_url))
+if _is_sqlite(_url):
+    event.listen(engine, "connect", _apply_sqlite_pragmas)
+    event.listen(async_engine.sync_engine, "connect", _apply_sqlite_pragmas)
+
 def get_session():
     logger.info('\nDefined [get_session] is initiated ')
     with Session(engine) as session:
         yield session
 
+async def get_async_session():
+    logger.info('\nDefined [get_async_session] is initiated ')
+    # expire_on_commit=False: routes keep using loaded rows after commit without lazy (blocking) refreshes.
+    async with AsyncSession(async_engine, expire_on_commit=False) as session:
+        yield session
+
+async def dispose_engines():
+    logger.info('\nDefined [dispose_engines] is initiated ')
+    await async_engine.dispose()
+    engine.dispose()
+
 def init_db():
     logger.info('\nDefined [init_db] is initiated ')
     SQLModel.metadata.create_all(engine)
+    migrate_db()
 
-def get_user_sessions(user_id: int):
-    logger.info(f"[get_user_sessions] fetching sessions for user {user_id}")
-    with Session(engine) as session:
-        statement = select(Conversation).where(Conversation.user_id == user_id)
-        results = session.exec(statement).all()
-        return results
-    
-    
\ No newline at end of file
+# Columns added after the first release; create_all() does not alter existing tables.
+ADDED_COLUMNS = {
+    "conversation": {
+        "summary": "TEXT NOT NULL DEFAULT ''",
+        "summary_upto": "INTEGER NOT NULL DEFAULT 0",
+        "summary_tokens": "INTEGER NOT NULL DEFAULT 0",
+    },
+    "message": {
+        "content_html": "TEXT",
+    },
+}
+
+def migrate_db():
+    logger.info('\nDefined [migrate_db] is initiated ')
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table, columns in ADDED_COLUMNS.items():
+            existing = {c["name"] for c in inspector.get_columns(table)}
+            for name, ddl in columns.items():
+                if name not in existing:
+                    logger.info(f"[migrate_db] adding {table}.{name}")
+                    conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {name} {ddl}"))
+    # Nor does it add indexes declared later on existing tables.
+    for table in SQLModel.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+    explode_message_blobs()
+    run_data_migrations()
+
+def explode_message_blobs(batch_size: int = 200):
+    """Move legacy Conversation.messages JSON blobs into Message rows (idempotent), a page of conversations at a time."""
+    logger.info('\nDefined [explode_message_blobs] is initiated ')
+    # Compared as text: Postgres has no json <> json operator.
+    has_blob = cast(Conversation.messages, Text) != "[]"
+    last_id = 0
+    while True:
+        with Session(engine) as session:
+            ids = session.exec(
+                select(Conversation.id).where(Conversation.id > last_id, has_blob)
+                .order_by(Conversation.id).limit(batch_size)
+            ).all()
+            if not ids:
+                return
+            last_id = ids[-1]
+            for convo in session.exec(select(Conversation).where(Conversation.id.in_(ids))).all():
+                _explode_blob(session, convo)
+            session.commit()
+
+
+def _explode_blob(session: Session, convo: Conversation):
+    if not convo.messages:
+        return
+    already = session.exec(select(Message.seq).where(Message.conversation_id == convo.id)).first()
+    if already is None:
+        for seq, m in enumerate(convo.messages, start=1):
+            tokenizer, token_count = next(iter((m.get("tokens") or {None: None}).items()))
+            role, content = m.get("role", "user"), m.get("content", "")
+            session.add(Message(
+                conversation_id=convo.id,
+                seq=seq,
+                role=role,
+                content=content,
+                content_html=render_message_html(role, content),
+                token_count=token_count,
+                tokenizer=tokenizer,
+                created_at=convo.created_at,
+                updated_at=convo.updated_at,
+            ))
+    convo.messages = []
+    session.add(convo)
+    logger.info(f"[explode_message_blobs] conversation {convo.id} migrated")
+
+
+def rerender_message_html(batch_size: int = 500):
+    """Re-render stored message HTML with the current sanitizer."""
+    logger.info('\nDefined [rerender_message_html] is initiated ')
+    last_id = 0
+    with engine.begin() as conn:
+        while True:
+            rows = conn.execute(
+                text("SELECT id, role, content FROM message WHERE content_html IS NOT NULL AND id > :last"
+                     " ORDER BY id LIMIT :n"),
+                {"last": last_id, "n": batch_size},
+            ).all()
+            if not rows:
+                return
+            conn.execute(
+                text("UPDATE message SET content_html = :html WHERE id = :id"),
+                [{"id": row.id, "html": render_message_html(row.role, row.content)} for row in rows],
+            )
+            last_id = rows[-1].id
+
+# One-off data fixes, applied once each in this order and recorded in data_migration.
+DATA_MIGRATIONS = {
+    # Links/images whose scheme was hidden behind character references ("&#106;avascript:")
+    # passed the old URL check and were stored as-is.
+    "rerender_message_html_entity_schemes": rerender_message_html,
+}
+
+def run_data_migrations():
+    logger.info('\nDefined [run_data_migrations] is initiated ')
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE IF NOT EXISTS data_migration (name VARCHAR(128) PRIMARY KEY)"))
+        applied = {row.name for row in conn.execute(text("SELECT name FROM data_migration"))}
+    for name, migration in DATA_MIGRATIONS.items():
+        if name in applied:
+            continue
+        logger.info(f"[run_data_migrations] applying {name}")
+        migration()
+        with engine.begin() as conn:
+            conn.execute(text("INSERT INTO data_migration (name) VALUES (:name)"), {"name": name})
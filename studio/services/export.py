@@ -0,0 +1,161 @@
+"""
+Streaming conversation exports.
+
+Exporters are async generators: messages are read from the database in
+pages of EXPORT_BATCH_SIZE and written straight to the response, so nothing
+is staged in memory or on disk. `export_all_zip` does the same for every
+conversation of a user, emitting the zip archive as it is built.
+"""
+import html
+import io
+import json
+import os
+import re
+import zipfile
+import logging
+from typing import AsyncIterator, Optional
+
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from studio.services.db import async_engine
+from studio.services.crud import get_messages, list_conversation_summaries
+from studio.services.models import Conversation, Message
+
+logger = logging.getLogger(__name__)
+
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "200"))
+
+HTML_HEAD = """<!DOCTYPE html>
+<html lang="en"><head><meta charset="utf-8"><title>{title}</title>
+<style>
+body {{ font-family: system-ui, sans-serif; max-width: 52rem; margin: 2rem auto; padding: 0 1rem; color: #111; }}
+.msg {{ margin: 1rem 0; padding: .75rem 1rem; border-radius: .75rem; }}
+.user {{ background: #e8f0fe; }} .assistant {{ background: #f4f4f5; }}
+.meta {{ font-size: .75rem; color: #666; margin-bottom: .25rem; }}
+.content {{ white-space: pre-wrap; }}
+</style></head><body>
+<h1>{title}</h1>
+"""
+HTML_TAIL = "</body></html>\n"
+
+
+async def iter_messages(conversation_id: int) -> AsyncIterator[Message]:
+    """All messages of a conversation in seq order, fetched page by page."""
+    after_seq = 0
+    async with AsyncSession(async_engine, expire_on_commit=False) as db:
+        while True:
+            page = await get_messages(db, conversation_id, after_seq=after_seq, limit=EXPORT_BATCH_SIZE)
+            for message in page:
+                yield message
+            if len(page) < EXPORT_BATCH_SIZE:
+                return
+            after_seq = page[-1].seq
+
+
+def _ts(message: Message) -> str:
+    return message.created_at.strftime("%Y-%m-%d %H:%M") if message.created_at else ""
+
+
+# ---------- Exporters ----------
+async def export_markdown(conversation: Conversation) -> AsyncIterator[str]:
+    yield f"# {conversation.name}\n\n"
+    async for m in iter_messages(conversation.id):
+        yield f"**{m.role.capitalize()}** ({_ts(m)}):\n\n{m.content}\n\n"
+
+
+async def export_jsonl(conversation: Conversation) -> AsyncIterator[str]:
+    async for m in iter_messages(conversation.id):
+        yield json.dumps({
+            "conversation_id": conversation.id,
+            "conversation": conversation.name,
+            "seq": m.seq,
+            "role": m.role,
+            "content": m.content,
+            "created_at": m.created_at.isoformat() if m.created_at else None,
+        }, ensure_ascii=False) + "\n"
+
+
+async def export_html(conversation: Conversation) -> AsyncIterator[str]:
+    yield HTML_HEAD.format(title=html.escape(conversation.name))
+    async for m in iter_messages(conversation.id):
+        yield (
+            f'<div class="msg {html.escape(m.role)}"><div class="meta">{html.escape(m.role.capitalize())} · {_ts(m)}</div>'
+            f'<div class="content">{html.escape(m.content)}</div></div>\n'
+        )
+    yield HTML_TAIL
+
+
+# format -> (exporter, media type)
+EXPORTERS = {
+    "md": (export_markdown, "text/markdown; charset=utf-8"),
+    "jsonl": (export_jsonl, "application/x-ndjson"),
+    "html": (export_html, "text/html; charset=utf-8"),
+}
+
+
+def export_filename(conversation_id: int, name: str, fmt: str) -> str:
+    slug = re.sub(r"[^A-Za-z0-9]+", "-", name).strip("-").lower()[:40] or "conversation"
+    return f"conversation_{conversation_id}_{slug}.{fmt}"
+
+
+async def export_conversation(conversation: Conversation, fmt: str) -> AsyncIterator[bytes]:
+    exporter, _ = EXPORTERS[fmt]
+    async for chunk in exporter(conversation):
+        yield chunk.encode("utf-8")
+
+
+# ---------- Bulk zip ----------
+class _ZipSink(io.RawIOBase):
+    """Write-only, non-seekable target for ZipFile; the caller drains what was written."""
+
+    def __init__(self):
+        super().__init__()
+        self._buffer = bytearray()
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._buffer += data
+        return len(data)
+
+    def drain(self) -> bytes:
+        data = bytes(self._buffer)
+        self._buffer.clear()
+        return data
+
+
+async def _iter_conversations(user_id: int) -> AsyncIterator[Conversation]:
+    cursor: Optional[str] = None
+    async with AsyncSession(async_engine, expire_on_commit=False) as db:
+        while True:
+            page, cursor = await list_conversation_summaries(db, user_id, limit=EXPORT_BATCH_SIZE, cursor=cursor)
+            for summary in page:
+                yield Conversation(id=summary.id, user_id=user_id, name=summary.name, updated_at=summary.updated_at)
+            if cursor is None:
+                return
+
+
+async def export_all_zip(user_id: int, fmt: str = "md") -> AsyncIterator[bytes]:
+    """
+    Zip of every conversation of `user_id`, one `fmt` file each. ZipFile writes
+    to a non-seekable sink (sizes go into data descriptors), and the sink is
+    drained after every chunk, so memory stays flat whatever the history size.
+    """
+    exporter, _ = EXPORTERS[fmt]
+    sink = _ZipSink()
+    with zipfile.ZipFile(sink, mode="w", compression=zipfile.ZIP_DEFLATED) as archive:
+        async for conversation in _iter_conversations(user_id):
+            info = zipfile.ZipInfo(
+                export_filename(conversation.id, conversation.name, fmt),
+                date_time=conversation.updated_at.timetuple()[:6],
+            )
+            info.compress_type = zipfile.ZIP_DEFLATED
+            with archive.open(info, mode="w", force_zip64=True) as entry:
+                async for chunk in exporter(conversation):
+                    entry.write(chunk.encode("utf-8"))
+                    data = sink.drain()
+                    if data:
+                        yield data
+    # Remaining entry data plus the central directory, written on close.
+    yield sink.drain()
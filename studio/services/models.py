@@ -1,5 +1,6 @@
 from typing import Optional, List, Dict
 from sqlmodel import SQLModel, Field, Relationship, Column, JSON, column
+from sqlalchemy import Index
 from sqlalchemy.dialects.sqlite import JSON as SQLITE_JSON
 from datetime import datetime, timezone 
 import logging
@@ -33,17 +34,58 @@ class UserConfig(SQLModel, table=True):
     
 class Conversation(SQLModel, table=True):
     logger.info('Defined [Conversation model] is initiated ')
+    __table_args__ = (
+        # Sidebar listing: newest-first per user, keyset-paginated on (updated_at, id).
+        Index("ix_conversation_user_updated", "user_id", "updated_at", "id"),
+    )
     id: Optional[int] = Field(default=None, primary_key=True)
     user_id: int = Field(foreign_key="user.id")
     name: str = Field(default="New Conversation")
     system_prompt: str = Field(default="You are a helpful AI assistant.")
     temperature: float = Field(default=0.7)
-    # messages: List[Dict] = Field(default_factory=list, sa_column=Column(JSON))
+    # Legacy JSON blob; migrate_db() explodes it into the Message table and empties it.
     messages: list[dict] = Field(default_factory=list, sa_column=Column(SQLITE_JSON))
-    # messages_list: List[Message] = Relationship(back_populates="conversation")
+    # Rolling summary of messages with seq <= summary_upto, maintained by studio.services.compaction
+    summary: str = Field(default="")
+    summary_upto: int = Field(default=0)
+    summary_tokens: int = Field(default=0)
     created_at: datetime = Field(default_factory=utc_now)
     updated_at: datetime = Field(default_factory=utc_now)
 
+class Message(SQLModel, table=True):
+    logger.info('Defined [Message model] is initiated ')
+    __table_args__ = (
+        Index("ix_message_conversation_seq", "conversation_id", "seq", unique=True),
+    )
+    id: Optional[int] = Field(default=None, primary_key=True)
+    conversation_id: int = Field(foreign_key="conversation.id")
+    seq: int                                   # 1-based position within the conversation
+    role: str
+    content: str
+    token_count: Optional[int] = Field(default=None)
+    tokenizer: Optional[str] = Field(default=None)   # tokenizer that produced token_count
+    content_html: Optional[str] = Field(default=None)   # sanitized HTML rendered at write time (assistant messages)
+    created_at: datetime = Field(default_factory=utc_now)
+    updated_at: datetime = Field(default_factory=utc_now)
+
+    def to_dict(self) -> dict:
+        """Chat-message view used by the context builder, templates and exports."""
+        data = {
+            "seq": self.seq,
+            "role": self.role,
+            "content": self.content,
+            "ts": self.created_at.strftime("%Y-%m-%d %H:%M") if self.created_at else "",
+        }
+        if self.token_count is not None:
+            data["tokens"] = {self.tokenizer: self.token_count}
+        return data
+
+class ConversationSummary(SQLModel):
+    logger.info('Defined [ConversationSummary model] is initiated ')
+    id: int
+    name: str
+    updated_at: datetime
+
 class ConversationRead(SQLModel):
     logger.info('Defined [ConversationRead model] is initiated ')
     id: int
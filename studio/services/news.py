@@ -0,0 +1,307 @@
+"""
+Headline aggregation across news providers.
+
+All enabled providers are queried at once, each under its own deadline. The
+result is the best one available by priority (NewsAPI > Google News RSS >
+NYT RSS): a lower-priority result is used only once every provider above it
+has failed, timed out or come back empty, and whatever is still running is
+cancelled as soon as the answer is known. Missing thumbnails are resolved
+only for the winning items (see news_images). Per-provider latency and
+error counters are exposed through `news_stats()`.
+"""
+import asyncio
+import os
+import time
+import logging
+from collections import deque
+from html import unescape
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+import feedparser
+import httpx
+
+from studio.services.news_cache import NewsCache
+from studio.services.news_extract import first_img_src
+from studio.services.news_feeds import FeedStore
+from studio.services.news_images import ImageResolver
+
+logger = logging.getLogger(__name__)
+
+# ---------- Config ----------
+NEWSAPI_KEY = os.getenv("NEWSAPI_KEY", "").strip()
+NEWS_CONNECT_TIMEOUT = float(os.getenv("NEWS_CONNECT_TIMEOUT", "2"))
+NEWS_IMAGE_BUDGET = float(os.getenv("NEWS_IMAGE_BUDGET", "3"))          # wait for article images per response
+NEWS_USER_AGENT = os.getenv("NEWS_USER_AGENT", "Mozilla/5.0 (compatible; AI-Studio news reader)")
+LATENCY_WINDOW = 200
+
+# Map simple region codes -> Google News RSS params (hl, gl, ceid)
+GOOGLE_RSS_REGIONS = {
+    "us": ("en-US", "US", "US:en"),
+    "in": ("en-IN", "IN", "IN:en"),
+    "uk": ("en-GB", "GB", "GB:en"),
+    "au": ("en-AU", "AU", "AU:en"),
+    "ca": ("en-CA", "CA", "CA:en"),
+    "sg": ("en-SG", "SG", "SG:en"),
+    "de": ("de-DE", "DE", "DE:de"),
+    "fr": ("fr-FR", "FR", "FR:fr"),
+    "es": ("es-ES", "ES", "ES:es"),
+}
+
+DEFAULT_REGION = "us"
+
+NEWSAPI_URL = "https://newsapi.org/v2/top-headlines"
+NYT_RSS = "https://rss.nytimes.com/services/xml/rss/nyt/HomePage.xml"
+
+_client: Optional[httpx.AsyncClient] = None
+
+
+def get_client() -> httpx.AsyncClient:
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            headers={"User-Agent": NEWS_USER_AGENT},
+            timeout=httpx.Timeout(10, connect=NEWS_CONNECT_TIMEOUT),
+            follow_redirects=True,
+        )
+    return _client
+
+
+image_resolver = ImageResolver(get_client)
+
+
+async def aclose():
+    global _client
+    await news_cache.close()
+    await image_resolver.aclose()
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+# ---------- Feed parsing ----------
+def _feed_image(entry) -> Optional[str]:
+    """Image carried by the feed itself: media:content / media:thumbnail, then an <img> in the body."""
+    if "media_content" in entry and entry.media_content:
+        url = entry.media_content[0].get("url")
+        if url: return url
+    if "media_thumbnail" in entry and entry.media_thumbnail:
+        url = entry.media_thumbnail[0].get("url")
+        if url: return url
+
+    html_blob = ""
+    if "content" in entry and entry.content:
+        html_blob = " ".join([c.get("value", "") for c in entry.content])
+    elif "summary" in entry:
+        html_blob = entry.summary or ""
+    return first_img_src(html_blob)
+
+
+def _normalize_entry(entry) -> dict:
+    return {
+        "title": unescape(getattr(entry, "title", "Untitled")),
+        "link": getattr(entry, "link", ""),
+        "published": getattr(entry, "published", "") or getattr(entry, "updated", ""),
+        "image": _feed_image(entry),
+    }
+
+
+def _parse_feed(content: bytes) -> List[dict]:
+    """Every entry of the feed; CPU-bound, runs in a worker thread."""
+    feed = feedparser.parse(content)
+    return [_normalize_entry(e) for e in feed.entries]
+
+
+feed_store = FeedStore(get_client, _parse_feed)
+
+
+def google_news_rss(region: str) -> str:
+    # Defaults to US if unknown region
+    hl, gl, ceid = GOOGLE_RSS_REGIONS.get(region.lower(), GOOGLE_RSS_REGIONS[DEFAULT_REGION])
+    return f"https://news.google.com/rss?hl={hl}&gl={gl}&ceid={ceid}"
+
+
+# ---------- Provider fetchers ----------
+async def _fetch_rss(url: str, limit: int) -> List[dict]:
+    return await feed_store.get(url, limit)
+
+
+async def fetch_newsapi(region: str, limit: int) -> List[dict]:
+    # NewsAPI country expects ISO 3166-1 alpha-2 (e.g., 'us', 'in')
+    params = {
+        "country": region.lower() if region.lower() in GOOGLE_RSS_REGIONS else DEFAULT_REGION,
+        "pageSize": limit,
+        "apiKey": NEWSAPI_KEY,
+    }
+    resp = await get_client().get(NEWSAPI_URL, params=params)
+    resp.raise_for_status()
+    return [
+        {
+            "title": a.get("title") or "Untitled",
+            "link": a.get("url") or "",
+            "published": a.get("publishedAt") or "",
+            "image": a.get("urlToImage"),
+        }
+        for a in (resp.json().get("articles") or [])[:limit]
+    ]
+
+
+async def fetch_google_rss(region: str, limit: int) -> List[dict]:
+    return await _fetch_rss(google_news_rss(region), limit)
+
+
+async def fetch_nyt(region: str, limit: int) -> List[dict]:
+    return await _fetch_rss(NYT_RSS, limit)
+
+
+# ---------- Providers ----------
+def _describe(error: Exception) -> str:
+    # Status only: request URLs carry the NewsAPI key.
+    if isinstance(error, httpx.HTTPStatusError):
+        return f"HTTP {error.response.status_code}"
+    return f"{type(error).__name__}: {error}"
+
+
+class NewsProvider:
+    def __init__(self, name: str, fetch: Callable[[str, int], Awaitable[List[dict]]], deadline: float,
+                 enabled: Callable[[], bool] = lambda: True):
+        self.name = name
+        self.fetch = fetch
+        self.deadline = deadline
+        self.enabled = enabled
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self.calls = 0
+        self.wins = 0
+        self.empty = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.cancelled = 0
+        self.last_error: Optional[str] = None
+
+    async def run(self, region: str, limit: int) -> List[dict]:
+        self.calls += 1
+        started = time.monotonic()
+        try:
+            items = await asyncio.wait_for(self.fetch(region, limit), self.deadline)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            self.last_error = f"deadline of {self.deadline}s exceeded"
+            logger.warning("[news] %s missed its %ss deadline", self.name, self.deadline)
+            raise
+        except asyncio.CancelledError:
+            # A higher-priority provider already answered.
+            self.cancelled += 1
+            raise
+        except Exception as e:
+            self.errors += 1
+            self.last_error = _describe(e)
+            logger.warning("[news] %s failed: %s", self.name, self.last_error)
+            raise
+        self.latencies.append(time.monotonic() - started)
+        if not items:
+            self.empty += 1
+        return items
+
+    def latency_percentile(self, pct: float) -> Optional[float]:
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        index = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+        return round(ordered[index], 3)
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled(),
+            "deadline_s": self.deadline,
+            "calls": self.calls,
+            "wins": self.wins,
+            "empty": self.empty,
+            "errors": self.errors,
+            "timeouts": self.timeouts,
+            "cancelled": self.cancelled,
+            "p50_s": self.latency_percentile(50),
+            "p95_s": self.latency_percentile(95),
+            "last_error": self.last_error,
+        }
+
+
+# Highest priority first.
+PROVIDERS: Dict[str, NewsProvider] = {
+    "newsapi": NewsProvider("newsapi", fetch_newsapi, float(os.getenv("NEWS_DEADLINE_NEWSAPI", "4")),
+                            enabled=lambda: bool(NEWSAPI_KEY)),
+    "google_rss": NewsProvider("google_rss", fetch_google_rss, float(os.getenv("NEWS_DEADLINE_GOOGLE_RSS", "4"))),
+    "nyt": NewsProvider("nyt", fetch_nyt, float(os.getenv("NEWS_DEADLINE_NYT", "5"))),
+}
+
+
+async def _race(names: List[str], region: str, limit: int) -> Tuple[Optional[str], List[dict]]:
+    """Start every provider now; take results in priority order and cancel whatever is left."""
+    tasks = {name: asyncio.create_task(PROVIDERS[name].run(region, limit)) for name in names}
+    try:
+        for name in names:
+            try:
+                items = await tasks[name]
+            except Exception:
+                continue
+            if items:
+                PROVIDERS[name].wins += 1
+                return name, items
+        return None, []
+    finally:
+        for task in tasks.values():
+            if not task.done():
+                task.cancel()
+            elif not task.cancelled():
+                task.exception()   # failures were logged in run(); mark them retrieved
+
+
+# ---------- Entry point ----------
+def normalize_region(region: str) -> str:
+    """Lower-cased region code; unsupported ones are served as DEFAULT_REGION, as the providers do."""
+    region = (region or "").strip().lower()
+    return region if region in GOOGLE_RSS_REGIONS else DEFAULT_REGION
+
+
+def normalize_provider(provider: str) -> str:
+    provider = (provider or "").strip().lower()
+    return provider if provider in PROVIDERS else "auto"
+
+
+async def fetch_news(region: str, limit: int, provider: str = "auto", images: str = "eager") -> dict:
+    """
+    `{"news", "source", "region"}` from `provider`, or from the best provider
+    when "auto". Missing images are resolved within NEWS_IMAGE_BUDGET
+    ("eager"), or only taken from the cache ("lazy"; the rest keep resolving
+    in the background for /api/news/images).
+    """
+    if provider in PROVIDERS and PROVIDERS[provider].enabled():
+        names = [provider]
+    else:
+        if provider == "newsapi":
+            logger.warning("provider=newsapi but NEWSAPI_KEY not set; falling back")
+        names = [name for name, p in PROVIDERS.items() if p.enabled()]
+
+    source, items = await _race(names, region, limit)
+    if source is None:
+        logger.error("[news] no provider answered (region=%s, providers=%s)", region, names)
+        return {"news": [], "source": "error", "region": region}
+    await image_resolver.fill(items, wait=NEWS_IMAGE_BUDGET if images == "eager" else 0)
+    return {"news": items, "source": source, "region": region}
+
+
+news_cache = NewsCache(fetch_news)
+
+
+def news_stats() -> dict:
+    return {name: p.stats() for name, p in PROVIDERS.items()}
+
+
+def image_stats() -> dict:
+    return image_resolver.stats()
+
+
+def cache_stats() -> dict:
+    return news_cache.stats()
+
+
+def feed_stats() -> dict:
+    return feed_store.stats()
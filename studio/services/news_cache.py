@@ -0,0 +1,189 @@
+"""
+Stale-while-revalidate cache in front of the news aggregator.
+
+Entries are fresh for NEWS_CACHE_TTL; after that they are still served,
+with a refresh started in the background, until NEWS_CACHE_STALE_TTL.
+Concurrent refreshes of one key share a single upstream fetch
+(SingleFlight), so an expiring key never stampedes the providers. Failed
+fetches are kept only for NEWS_CACHE_ERROR_TTL, and never replace a good
+payload that is still within its stale window. A background task refreshes
+the most-requested keys shortly before they expire, so hot regions are
+never served from a cold fetch. Entries and demand counters are both
+bounded with LRU eviction.
+"""
+import asyncio
+import os
+import time
+import logging
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Optional, Set, Tuple
+
+from chat_client.singleflight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+NEWS_CACHE_SIZE = int(os.getenv("NEWS_CACHE_SIZE", "256"))
+NEWS_CACHE_TTL = float(os.getenv("NEWS_CACHE_TTL", "300"))
+NEWS_CACHE_STALE_TTL = float(os.getenv("NEWS_CACHE_STALE_TTL", "3600"))
+NEWS_CACHE_ERROR_TTL = float(os.getenv("NEWS_CACHE_ERROR_TTL", "30"))
+NEWS_WARM_INTERVAL = float(os.getenv("NEWS_WARM_INTERVAL", "60"))       # 0 disables the warmer
+NEWS_WARM_KEYS = int(os.getenv("NEWS_WARM_KEYS", "8"))
+DEMAND_DECAY = 0.5       # per warm cycle, so "hot" means recently requested
+
+# (region, limit, provider, images)
+NewsKey = Tuple[str, int, str, str]
+
+
+class _Entry:
+    __slots__ = ("payload", "fetched_at", "ttl", "failed", "retry_at")
+
+    def __init__(self, payload: dict, fetched_at: float, ttl: float, failed: bool):
+        self.payload = payload
+        self.fetched_at = fetched_at
+        self.ttl = ttl
+        self.failed = failed
+        self.retry_at = fetched_at
+
+
+class NewsCache:
+    def __init__(self, loader: Callable[[str, int, str, str], Awaitable[dict]], max_entries: int = NEWS_CACHE_SIZE,
+                 ttl: float = NEWS_CACHE_TTL, stale_ttl: float = NEWS_CACHE_STALE_TTL,
+                 error_ttl: float = NEWS_CACHE_ERROR_TTL):
+        self._loader = loader
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.error_ttl = error_ttl
+        self._entries: "OrderedDict[NewsKey, _Entry]" = OrderedDict()
+        self._flight = SingleFlight("news")
+        self._demand: "OrderedDict[NewsKey, float]" = OrderedDict()
+        self._background: Set[asyncio.Task] = set()
+        self._warmer: Optional[asyncio.Task] = None
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.refresh_failures = 0
+        self.evictions = 0
+        self.warm_runs = 0
+        self.warm_refreshes = 0
+
+    # ---------- Lookup ----------
+    async def get(self, region: str, limit: int, provider: str, images: str) -> dict:
+        key: NewsKey = (region.lower(), limit, provider, images)
+        self._demand[key] = self._demand.get(key, 0.0) + 1
+        self._demand.move_to_end(key)
+        if len(self._demand) > self.max_entries:
+            self._demand.popitem(last=False)
+        entry = self._entries.get(key)
+        now = time.monotonic()
+        if entry is not None:
+            self._entries.move_to_end(key)
+            age = now - entry.fetched_at
+            if age < entry.ttl:
+                self.hits += 1
+                return entry.payload
+            if not entry.failed and age < self.stale_ttl:
+                self.stale_hits += 1
+                if now >= entry.retry_at:
+                    self._refresh_in_background(key)
+                return entry.payload
+        self.misses += 1
+        return await self._refresh(key)
+
+    async def _refresh(self, key: NewsKey) -> dict:
+        return await self._flight.do(repr(key), lambda: self._load(key))
+
+    def _refresh_in_background(self, key: NewsKey):
+        task = asyncio.get_running_loop().create_task(self._refresh(key))
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+
+    async def _load(self, key: NewsKey) -> dict:
+        region, limit, provider, images = key
+        self.refreshes += 1
+        try:
+            payload = await self._loader(region, limit, provider, images)
+        except Exception as e:
+            logger.exception("[news cache] refresh of %s failed: %s", key, e)
+            payload = {"news": [], "source": "error", "region": region}
+
+        now = time.monotonic()
+        if payload.get("source") != "error":
+            self._store(key, _Entry(payload, now, self.ttl, failed=False))
+            return payload
+
+        self.refresh_failures += 1
+        previous = self._entries.get(key)
+        if previous is not None and not previous.failed and now - previous.fetched_at < self.stale_ttl:
+            # Keep serving the last good headlines; try again after error_ttl.
+            previous.retry_at = now + self.error_ttl
+            return previous.payload
+        self._store(key, _Entry(payload, now, self.error_ttl, failed=True))
+        return payload
+
+    def _store(self, key: NewsKey, entry: _Entry):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    # ---------- Warmer ----------
+    def start(self, interval: float = NEWS_WARM_INTERVAL):
+        if interval <= 0:
+            return
+        loop = asyncio.get_running_loop()
+        if self._warmer is not None and not self._warmer.done() and self._warmer.get_loop() is loop:
+            return
+        self._warmer = loop.create_task(self._warm_loop(interval))
+
+    async def close(self):
+        tasks = list(self._background)
+        if self._warmer is not None:
+            tasks.append(self._warmer)
+            self._warmer = None
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _warm_loop(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.warm(interval)
+            except Exception as e:
+                logger.exception("[news cache] warm cycle failed: %s", e)
+
+    async def warm(self, horizon: float = NEWS_WARM_INTERVAL):
+        """Refresh the most-requested keys that would go stale within `horizon` seconds."""
+        self.warm_runs += 1
+        hot = sorted(self._demand.items(), key=lambda kv: kv[1], reverse=True)[:NEWS_WARM_KEYS]
+        self._demand = OrderedDict(
+            (key, count * DEMAND_DECAY) for key, count in self._demand.items() if count * DEMAND_DECAY >= 0.1
+        )
+        now = time.monotonic()
+        due = []
+        for key, _ in hot:
+            entry = self._entries.get(key)
+            if entry is None or now + horizon - entry.fetched_at >= entry.ttl:
+                due.append(key)
+        if due:
+            self.warm_refreshes += len(due)
+            await asyncio.gather(*(self._refresh(key) for key in due), return_exceptions=True)
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "refreshes": self.refreshes,
+            "refresh_failures": self.refresh_failures,
+            "evictions": self.evictions,
+            "warm_runs": self.warm_runs,
+            "warm_refreshes": self.warm_refreshes,
+            "hot_keys": [f"{r}:{l}:{p}:{i}" for (r, l, p, i), _ in
+                         sorted(self._demand.items(), key=lambda kv: kv[1], reverse=True)[:NEWS_WARM_KEYS]],
+            "single_flight": self._flight.stats(),
+        }
@@ -0,0 +1,90 @@
+"""
+Cheap image extraction for news items.
+
+Feed bodies and article heads are scanned with precompiled regexes first;
+lxml is only used when a tag is there but the regex could not read it.
+Article pages are read as a stream and only up to `</head>` (or
+NEWS_HEAD_MAX_BYTES), since og:image / twitter:image live in the head.
+"""
+import os
+import re
+import logging
+from html import unescape
+from typing import Optional
+
+import httpx
+import lxml.etree
+import lxml.html
+
+logger = logging.getLogger(__name__)
+
+NEWS_HEAD_MAX_BYTES = int(os.getenv("NEWS_HEAD_MAX_BYTES", str(256 * 1024)))
+
+IMG_TAG_RE = re.compile(r"""<img\b[^>]*?\ssrc\s*=\s*(?:"([^"]+)"|'([^']+)'|([^\s"'>]+))""", re.IGNORECASE)
+META_TAG_RE = re.compile(r"<meta\b[^>]*>", re.IGNORECASE)
+ATTR_RE = re.compile(r"""([a-zA-Z_:][-a-zA-Z0-9_:.]*)\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s"'>]+))""")
+HEAD_END = b"</head>"
+# Most specific first.
+META_IMAGE_KEYS = ("og:image:secure_url", "og:image:url", "og:image", "twitter:image", "twitter:image:src")
+
+
+# ---------- Feed bodies ----------
+def first_img_src(html_blob: str) -> Optional[str]:
+    """src of the first <img> in an HTML fragment."""
+    if not html_blob or "<img" not in html_blob.lower():
+        return None
+    match = IMG_TAG_RE.search(html_blob)
+    if match:
+        return unescape(next(group for group in match.groups() if group))
+    try:
+        srcs = lxml.html.fragment_fromstring(html_blob, create_parent="div").xpath("//img/@src")
+    except (ValueError, lxml.etree.ParserError):
+        return None
+    return srcs[0] if srcs else None
+
+
+# ---------- Article heads ----------
+def _meta_attrs(tag: str) -> dict:
+    return {m.group(1).lower(): unescape(m.group(2) or m.group(3) or m.group(4) or "") for m in ATTR_RE.finditer(tag)}
+
+
+def meta_image(head_html: str) -> Optional[str]:
+    """og:image / twitter:image from the <meta> tags of an HTML head."""
+    found = {}
+    for tag in META_TAG_RE.findall(head_html):
+        attrs = _meta_attrs(tag)
+        key = (attrs.get("property") or attrs.get("name") or "").lower()
+        if key in META_IMAGE_KEYS and attrs.get("content") and key not in found:
+            found[key] = attrs["content"].strip()
+    if not found and "og:image" in head_html:
+        # Unusual markup the regexes could not read; let lxml have a go.
+        try:
+            doc = lxml.html.fromstring(head_html)
+        except (ValueError, lxml.etree.ParserError):
+            return None
+        for key in META_IMAGE_KEYS:
+            values = doc.xpath(f'//meta[@property="{key}" or @name="{key}"]/@content')
+            if values:
+                return values[0].strip()
+        return None
+    for key in META_IMAGE_KEYS:
+        if key in found:
+            return found[key]
+    return None
+
+
+async def read_head(resp: httpx.Response, max_bytes: int = NEWS_HEAD_MAX_BYTES) -> str:
+    """Read a streamed response only until `</head>` or `max_bytes`, whichever comes first."""
+    buffer = bytearray()
+    async for chunk in resp.aiter_bytes():
+        # Look a few bytes back so a tag split across chunks is still seen.
+        start = max(0, len(buffer) - len(HEAD_END))
+        buffer += chunk
+        end = bytes(buffer[start:]).lower().find(HEAD_END)
+        if end != -1:
+            del buffer[start + end + len(HEAD_END):]
+            break
+        if len(buffer) >= max_bytes:
+            del buffer[max_bytes:]
+            break
+    return buffer.decode(resp.encoding or "utf-8", errors="replace")
@@ -0,0 +1,118 @@
+"""
+Shared parsed-feed layer for RSS providers.
+
+Each feed URL is downloaded and parsed once, whatever `limit` callers ask
+for; readers slice the stored entries. Refreshes are conditional GETs
+(If-None-Match / If-Modified-Since), so an unchanged feed costs a 304 and no
+parse. Within FEED_FRESH_SECONDS of the last check the stored entries are
+served without any request, and concurrent refreshes of one URL share a
+single download. `stats()` reports the bytes and parse time saved against
+downloading and parsing on every read.
+"""
+import asyncio
+import os
+import time
+import logging
+from collections import OrderedDict
+from typing import Callable, List, Optional
+
+import httpx
+
+from chat_client.singleflight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+FEED_FRESH_SECONDS = float(os.getenv("FEED_FRESH_SECONDS", "60"))
+FEED_STORE_SIZE = int(os.getenv("FEED_STORE_SIZE", "64"))
+
+
+class _Feed:
+    __slots__ = ("items", "etag", "last_modified", "body_bytes", "parse_ms", "checked_at")
+
+    def __init__(self, items: List[dict], etag: Optional[str], last_modified: Optional[str], body_bytes: int, parse_ms: float):
+        self.items = items
+        self.etag = etag
+        self.last_modified = last_modified
+        self.body_bytes = body_bytes
+        self.parse_ms = parse_ms
+        self.checked_at = time.monotonic()
+
+
+class FeedStore:
+    def __init__(self, get_client: Callable[[], httpx.AsyncClient], parse: Callable[[bytes], List[dict]],
+                 fresh_seconds: float = FEED_FRESH_SECONDS, max_feeds: int = FEED_STORE_SIZE):
+        self._get_client = get_client
+        self._parse = parse
+        self.fresh_seconds = fresh_seconds
+        self.max_feeds = max_feeds
+        self._feeds: "OrderedDict[str, _Feed]" = OrderedDict()
+        self._flight = SingleFlight("feeds")
+        self.reads = 0
+        self.served_fresh = 0
+        self.not_modified = 0
+        self.downloads = 0
+        self.bytes_downloaded = 0
+        self.bytes_saved = 0
+        self.parse_ms = 0.0
+        self.parse_ms_saved = 0.0
+
+    async def get(self, url: str, limit: int) -> List[dict]:
+        """The first `limit` entries of the feed at `url` (copies; callers may annotate them)."""
+        self.reads += 1
+        feed = self._feeds.get(url)
+        if feed is not None and time.monotonic() - feed.checked_at < self.fresh_seconds:
+            self.served_fresh += 1
+            self.bytes_saved += feed.body_bytes
+            self.parse_ms_saved += feed.parse_ms
+            self._feeds.move_to_end(url)
+        else:
+            feed = await self._flight.do(url, lambda: self._refresh(url))
+        return [dict(item) for item in feed.items[:limit]]
+
+    async def _refresh(self, url: str) -> _Feed:
+        previous = self._feeds.get(url)
+        headers = {}
+        if previous is not None:
+            if previous.etag:
+                headers["If-None-Match"] = previous.etag
+            if previous.last_modified:
+                headers["If-Modified-Since"] = previous.last_modified
+
+        resp = await self._get_client().get(url, headers=headers)
+        if resp.status_code == 304 and previous is not None:
+            self.not_modified += 1
+            self.bytes_saved += previous.body_bytes
+            self.parse_ms_saved += previous.parse_ms
+            previous.checked_at = time.monotonic()
+            self._feeds.move_to_end(url)
+            return previous
+        resp.raise_for_status()
+
+        body = resp.content
+        self.downloads += 1
+        self.bytes_downloaded += len(body)
+        started = time.perf_counter()
+        items = await asyncio.to_thread(self._parse, body)
+        parse_ms = (time.perf_counter() - started) * 1000
+        self.parse_ms += parse_ms
+
+        feed = _Feed(items, resp.headers.get("etag"), resp.headers.get("last-modified"), len(body), parse_ms)
+        self._feeds[url] = feed
+        self._feeds.move_to_end(url)
+        while len(self._feeds) > self.max_feeds:
+            self._feeds.popitem(last=False)
+        return feed
+
+    def stats(self) -> dict:
+        return {
+            "feeds": len(self._feeds),
+            "reads": self.reads,
+            "served_fresh": self.served_fresh,
+            "not_modified": self.not_modified,
+            "downloads": self.downloads,
+            "bytes_downloaded": self.bytes_downloaded,
+            "bytes_saved": self.bytes_saved,
+            "parse_ms": round(self.parse_ms, 2),
+            "parse_ms_saved": round(self.parse_ms_saved, 2),
+            "single_flight": self._flight.stats(),
+        }
@@ -0,0 +1,244 @@
+"""
+Article image resolution for news items without a feed image.
+
+Lookups go memory LRU -> SQLite file (NEWS_IMAGE_CACHE_DB, if set) -> network. Page
+fetches read only the <head> (see news_extract), run concurrently under
+one semaphore (NEWS_IMAGE_CONCURRENCY), at most once per link at a time,
+and keep running after the request that started them has returned, so
+their result lands in the cache either way.
+Both hits and "page has no og:image" answers are cached by article URL;
+transient failures (timeouts, 5xx) are not.
+"""
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+import logging
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+from urllib.parse import urljoin
+
+import httpx
+
+from studio.services.news_extract import meta_image, read_head
+
+logger = logging.getLogger(__name__)
+
+NEWS_IMAGE_CACHE_DB = os.getenv("NEWS_IMAGE_CACHE_DB", "").strip() or None   # unset: memory only
+NEWS_IMAGE_TTL = float(os.getenv("NEWS_IMAGE_TTL", str(7 * 24 * 3600)))
+NEWS_IMAGE_NEGATIVE_TTL = float(os.getenv("NEWS_IMAGE_NEGATIVE_TTL", str(24 * 3600)))
+NEWS_IMAGE_CONCURRENCY = int(os.getenv("NEWS_IMAGE_CONCURRENCY", "8"))
+NEWS_IMAGE_TIMEOUT = float(os.getenv("NEWS_IMAGE_TIMEOUT", "3"))        # one article page fetch
+NEWS_IMAGE_MEMORY_SIZE = int(os.getenv("NEWS_IMAGE_MEMORY_SIZE", "4096"))
+KNOWN_LINKS_SIZE = 2048
+
+
+class _ImageStore:
+    """SQLite link -> image table (image NULL = page has none); blocking, call via asyncio.to_thread."""
+
+    def __init__(self, path: str):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS news_image ("
+            " link TEXT PRIMARY KEY, image TEXT, resolved_at REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+    def get_many(self, links: List[str]) -> Dict[str, Tuple[float, Optional[str]]]:
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT link, image, resolved_at FROM news_image WHERE link IN ({','.join('?' * len(links))})",
+                links,
+            ).fetchall()
+        return {link: (resolved_at, image) for link, image, resolved_at in rows}
+
+    def set(self, link: str, image: Optional[str], resolved_at: float):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO news_image (link, image, resolved_at) VALUES (?, ?, ?)",
+                (link, image, resolved_at),
+            )
+            self._conn.commit()
+
+    def purge_expired(self, ttl: float, negative_ttl: float) -> int:
+        now = time.time()
+        with self._lock:
+            cur = self._conn.execute(
+                "DELETE FROM news_image WHERE (image IS NOT NULL AND resolved_at < ?)"
+                " OR (image IS NULL AND resolved_at < ?)",
+                (now - ttl, now - negative_ttl),
+            )
+            self._conn.commit()
+            return cur.rowcount
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class ImageResolver:
+    def __init__(self, get_client: Callable[[], httpx.AsyncClient], db_path: Optional[str] = NEWS_IMAGE_CACHE_DB,
+                 concurrency: int = NEWS_IMAGE_CONCURRENCY):
+        self._get_client = get_client
+        self._db_path = db_path
+        self._store: Optional[_ImageStore] = None
+        self._store_lock = threading.Lock()
+        self._concurrency = concurrency
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._memory: "OrderedDict[str, tuple]" = OrderedDict()   # link -> (resolved_at, image or None)
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self._known: "OrderedDict[str, None]" = OrderedDict()    # links handed out by /api/news
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.fetched = 0
+        self.found = 0
+        self.not_found = 0
+        self.errors = 0
+        self.head_bytes = 0
+
+    # ---------- Cache ----------
+    def _store_or_none(self) -> Optional[_ImageStore]:
+        """Opened on first use, from a worker thread."""
+        with self._store_lock:
+            if self._store is None and self._db_path:
+                self._store = _ImageStore(self._db_path)
+                purged = self._store.purge_expired(NEWS_IMAGE_TTL, NEWS_IMAGE_NEGATIVE_TTL)
+                logger.info("News image cache at %s (purged %s expired entries)", self._db_path, purged)
+            return self._store
+
+    @staticmethod
+    def _fresh(resolved_at: float, image: Optional[str]) -> bool:
+        ttl = NEWS_IMAGE_TTL if image else NEWS_IMAGE_NEGATIVE_TTL
+        return time.time() - resolved_at < ttl
+
+    def _remember(self, link: str, resolved_at: float, image: Optional[str]):
+        self._memory[link] = (resolved_at, image)
+        self._memory.move_to_end(link)
+        while len(self._memory) > NEWS_IMAGE_MEMORY_SIZE:
+            self._memory.popitem(last=False)
+
+    async def lookup(self, links: Iterable[str]) -> Dict[str, Optional[str]]:
+        """Cached answers for `links` (None = known to have no image); unknown links are left out."""
+        found: Dict[str, Optional[str]] = {}
+        misses = []
+        for link in links:
+            item = self._memory.get(link)
+            if item is not None and self._fresh(*item):
+                self._memory.move_to_end(link)
+                self.memory_hits += 1
+                found[link] = item[1]
+            else:
+                misses.append(link)
+        if misses and self._db_path:
+            rows = await asyncio.to_thread(lambda: self._store_or_none().get_many(misses))
+            for link, (resolved_at, image) in rows.items():
+                if self._fresh(resolved_at, image):
+                    self.disk_hits += 1
+                    self._remember(link, resolved_at, image)
+                    found[link] = image
+        return found
+
+    # ---------- Network ----------
+    async def _fetch(self, link: str) -> Optional[str]:
+        """og/twitter image of the article, reading the page only up to </head>."""
+        async with self._get_client().stream("GET", link, timeout=NEWS_IMAGE_TIMEOUT) as resp:
+            if resp.status_code >= 500 or resp.status_code == 429:
+                resp.raise_for_status()   # transient: don't cache
+            if resp.status_code >= 400:
+                return None
+            head = await read_head(resp)
+            self.head_bytes += len(head)
+        image = meta_image(head)
+        return urljoin(str(resp.url), image) if image else None
+
+    async def _resolve(self, link: str) -> Optional[str]:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self._concurrency)
+        async with self._semaphore:
+            self.fetched += 1
+            try:
+                image = await self._fetch(link)
+            except Exception as e:
+                self.errors += 1
+                logger.info("[news images] %s: %s", link, type(e).__name__)
+                return None
+        if image:
+            self.found += 1
+        else:
+            self.not_found += 1
+        resolved_at = time.time()
+        self._remember(link, resolved_at, image)
+        if self._db_path:
+            await asyncio.to_thread(lambda: self._store_or_none().set(link, image, resolved_at))
+        return image
+
+    def _schedule(self, link: str) -> asyncio.Task:
+        task = self._inflight.get(link)
+        if task is None:
+            task = asyncio.create_task(self._resolve(link))
+            self._inflight[link] = task
+            task.add_done_callback(lambda t, k=link: self._inflight.pop(k, None) if self._inflight.get(k) is t else None)
+        return task
+
+    # ---------- Public API ----------
+    async def images_for(self, links: List[str], wait: float, known_only: bool = False) -> Tuple[Dict[str, Optional[str]], List[str]]:
+        """
+        Images for `links`: cached answers, then fetches for the rest, waiting at
+        most `wait` seconds. Returns (link -> image or None, links still pending).
+        With `known_only`, links that never appeared in a news response are ignored.
+        """
+        if known_only:
+            links = [link for link in links if link in self._known]
+        else:
+            for link in links:
+                self._known[link] = None
+                self._known.move_to_end(link)
+            while len(self._known) > KNOWN_LINKS_SIZE:
+                self._known.popitem(last=False)
+
+        images = await self.lookup(links)
+        tasks = {link: self._schedule(link) for link in links if link not in images}
+        if tasks and wait > 0:
+            await asyncio.wait(tasks.values(), timeout=wait)
+        pending = []
+        for link, task in tasks.items():
+            if task.done():
+                images[link] = None if task.cancelled() else task.result()
+            else:
+                pending.append(link)
+        return images, pending
+
+    async def fill(self, items: List[dict], wait: float) -> Set[str]:
+        """Set `image` on items that lack one; returns the links still being resolved."""
+        links = [item["link"] for item in items if not item.get("image") and item.get("link")]
+        if not links:
+            return set()
+        images, pending = await self.images_for(links, wait)
+        for item in items:
+            if not item.get("image") and item.get("link") in images:
+                item["image"] = images[item["link"]]
+        return set(pending)
+
+    async def aclose(self):
+        for task in list(self._inflight.values()):
+            task.cancel()
+        if self._store is not None:
+            self._store.close()
+            self._store = None
+
+    def stats(self) -> dict:
+        return {
+            "memory_entries": len(self._memory),
+            "in_flight": len(self._inflight),
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "fetched": self.fetched,
+            "found": self.found,
+            "not_found": self.not_found,
+            "errors": self.errors,
+            "head_bytes_read": self.head_bytes,
+            "disk_tier": bool(self._db_path),
+        }
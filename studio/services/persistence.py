@@ -0,0 +1,220 @@
+"""
+Write-behind persistence for chat turns.
+
+Finished turns are queued instead of being written on the request path. A
+background task drains the queue and writes everything that accumulated in
+one transaction (group commit), so concurrent chats share commits.
+`barrier(conversation_id)` waits until a conversation's queued turns are
+committed (read-your-writes for the next page load or send), and `close()`
+flushes the queue on shutdown; turns submitted once it has started are
+written one by one and awaited by `close()`.
+"""
+import asyncio
+import os
+import time
+import logging
+from typing import Dict, List, Optional, Set, Tuple
+
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from chat_client.context_builder import message_token_cache
+from studio.services.db import async_engine
+from studio.services.crud import append_message, append_turns
+from tools.MARKDOWN.render import render_message_html
+
+logger = logging.getLogger(__name__)
+
+FLUSH_INTERVAL_S = float(os.getenv("PERSIST_FLUSH_INTERVAL_MS", "20")) / 1000
+MAX_BATCH_TURNS = int(os.getenv("PERSIST_MAX_BATCH", "256"))
+
+_STOP = object()
+
+
+class _Turn:
+    __slots__ = ("conversation_id", "user_id", "messages", "model_config", "future")
+
+    def __init__(self, conversation_id: int, user_id: int, messages: List[Tuple[str, str, Optional[dict]]],
+                 model_config: Optional[dict], future: asyncio.Future):
+        self.conversation_id = conversation_id
+        self.user_id = user_id
+        self.messages = messages
+        self.model_config = model_config
+        self.future = future
+
+    def as_dict(self) -> dict:
+        return {"conversation_id": self.conversation_id, "user_id": self.user_id, "messages": self.messages}
+
+
+def _prerender(turns: List[_Turn]):
+    for turn in turns:
+        if turn.model_config is not None:
+            turn.messages = [
+                (role, content, tokens if tokens is not None else message_token_cache(turn.model_config, content))
+                for role, content, tokens in turn.messages
+            ]
+        for role, content, _ in turn.messages:
+            render_message_html(role, content)
+
+
+async def _write_batch(turns: List[dict]) -> int:
+    async with AsyncSession(async_engine, expire_on_commit=False) as db:
+        return await append_turns(db, turns)
+
+
+async def _write_one(turn: dict) -> int:
+    written = 0
+    async with AsyncSession(async_engine, expire_on_commit=False) as db:
+        for role, content, tokens in turn["messages"]:
+            if await append_message(db, turn["conversation_id"], turn["user_id"], role, content, tokens) is not None:
+                written += 1
+    return written
+
+
+class TurnWriter:
+    def __init__(self):
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._pending: Dict[int, asyncio.Future] = {}        # conversation id -> future of its newest queued turn
+        self._pending_users: Dict[int, asyncio.Future] = {}  # user id -> future of their newest queued turn
+        self._closing = False
+        self._late: Set[asyncio.Task] = set()                # writes of turns submitted during close()
+        self._late_tail: Optional[asyncio.Task] = None
+        self.turns_written = 0
+        self.messages_written = 0
+        self.batches = 0
+        self.failed = 0
+        self.last_flush_ms = 0.0
+
+    # ---------- Lifecycle ----------
+    def start(self):
+        self._closing = False
+        self._late_tail = None
+        loop = asyncio.get_running_loop()
+        if self._task is not None and not self._task.done() and self._task.get_loop() is loop:
+            return
+        self._queue = asyncio.Queue()
+        self._task = loop.create_task(self._run())
+
+    async def close(self):
+        """Flush everything queued so far and stop the writer."""
+        self._closing = True
+        if self._task is not None and not self._task.done():
+            self._queue.put_nowait(_STOP)
+            await self._task
+            self._task = None
+        while self._late:
+            await asyncio.gather(*self._late, return_exceptions=True)
+
+    # ---------- Producer side ----------
+    def submit(self, conversation_id: int, user_id: int, messages: List[Tuple[str, str, Optional[dict]]],
+               model_config: Optional[dict] = None):
+        """
+        Queue a finished turn; `messages` is a list of (role, content, tokens). Never blocks:
+        with `model_config`, tokens left as None are counted on the writer's thread.
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending[conversation_id] = future
+        self._pending_users[user_id] = future
+        turn = _Turn(conversation_id, user_id, messages, model_config, future)
+        if self._closing:
+            # The writer may already have drained its queue; don't restart it behind close()'s back.
+            task = loop.create_task(self._write_late(turn, self._late_tail or self._task))
+            self._late_tail = task
+            self._late.add(task)
+            task.add_done_callback(lambda t: self._late_done(t, turn))
+            return
+        self.start()
+        self._queue.put_nowait(turn)
+
+    async def barrier(self, conversation_id: int):
+        """Wait until every turn queued for `conversation_id` is committed."""
+        future = self._pending.get(conversation_id)
+        if future is not None and not future.done():
+            await asyncio.shield(future)
+
+    async def barrier_user(self, user_id: int):
+        """Wait until every turn queued by `user_id` (any conversation) is committed."""
+        future = self._pending_users.get(user_id)
+        if future is not None and not future.done():
+            await asyncio.shield(future)
+
+    # ---------- Writer task ----------
+    async def _run(self):
+        stopping = False
+        while not stopping:
+            item = await self._queue.get()
+            batch: List[_Turn] = []
+            if item is _STOP:
+                stopping = True
+            else:
+                batch.append(item)
+                # Give concurrent requests a moment to join this commit.
+                await asyncio.sleep(FLUSH_INTERVAL_S)
+            while len(batch) < MAX_BATCH_TURNS:
+                try:
+                    item = self._queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                else:
+                    batch.append(item)
+            if batch:
+                await self._flush(batch)
+
+    async def _write_late(self, turn: _Turn, after: Optional[asyncio.Task]):
+        if after is not None:
+            await asyncio.wait([after])   # the writer's last batch / previous late turn, to keep turn order
+        await self._flush([turn])
+
+    def _late_done(self, task: asyncio.Task, turn: _Turn):
+        self._late.discard(task)
+        if task.cancelled():
+            # The loop went away before close() (or anyone) awaited the write.
+            self.failed += 1
+            logger.error(f"[persistence] dropping turn for conversation {turn.conversation_id}: submitted after shutdown")
+            if not turn.future.done():
+                turn.future.set_result(None)
+
+    async def _flush(self, batch: List[_Turn]):
+        started = time.perf_counter()
+        try:
+            # Count tokens and render Markdown off the event loop; the inserts then hit the render cache.
+            await asyncio.to_thread(_prerender, batch)
+            turns = [t.as_dict() for t in batch]
+            self.messages_written += await _write_batch(turns)
+            self.turns_written += len(batch)
+        except Exception as e:
+            # Don't let one bad turn take the whole batch down with it.
+            logger.error(f"[persistence] group commit of {len(batch)} turns failed: {e!r}; retrying one by one")
+            for turn in batch:
+                try:
+                    self.messages_written += await _write_one(turn.as_dict())
+                    self.turns_written += 1
+                except Exception as turn_error:
+                    self.failed += 1
+                    logger.error(f"[persistence] dropping turn for conversation {turn.conversation_id}: {turn_error!r}")
+        self.batches += 1
+        self.last_flush_ms = round((time.perf_counter() - started) * 1000, 2)
+        for turn in batch:
+            if not turn.future.done():
+                turn.future.set_result(None)
+            if self._pending.get(turn.conversation_id) is turn.future:
+                del self._pending[turn.conversation_id]
+            if self._pending_users.get(turn.user_id) is turn.future:
+                del self._pending_users[turn.user_id]
+
+    def stats(self) -> dict:
+        return {
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "turns_written": self.turns_written,
+            "messages_written": self.messages_written,
+            "batches": self.batches,
+            "avg_batch_turns": round(self.turns_written / self.batches, 2) if self.batches else 0.0,
+            "failed_turns": self.failed,
+            "last_flush_ms": self.last_flush_ms,
+        }
+
+
+turn_writer = TurnWriter()
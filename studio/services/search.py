@@ -0,0 +1,166 @@
+"""
+Full-text search over chat messages.
+
+SQLite: an external-content FTS5 table (`message_fts`) over message.content,
+kept in sync by insert/update/delete triggers and ranked with bm25().
+Postgres: a stored tsvector column with a GIN index, ranked with ts_rank_cd().
+Both are maintained by the database as messages are appended, so the write
+path stays unchanged. Rebuild existing data with:
+
+    python -m studio.services.search reindex
+"""
+import html
+import re
+import sys
+import logging
+from typing import List, Optional, Tuple
+
+from sqlalchemy import text
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from studio.services.db import engine
+
+logger = logging.getLogger(__name__)
+
+SEARCH_LANGUAGE = "english"
+SNIPPET_TOKENS = 16
+# Match markers that cannot occur in chat text; swapped for <mark> after HTML-escaping.
+_OPEN, _CLOSE = "\x02", "\x03"
+
+SQLITE_DDL = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS message_fts USING fts5(
+        content, content='message', content_rowid='id', tokenize='porter unicode61'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS message_fts_ai AFTER INSERT ON message BEGIN
+        INSERT INTO message_fts(rowid, content) VALUES (new.id, new.content);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS message_fts_ad AFTER DELETE ON message BEGIN
+        INSERT INTO message_fts(message_fts, rowid, content) VALUES ('delete', old.id, old.content);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS message_fts_au AFTER UPDATE OF content ON message BEGIN
+        INSERT INTO message_fts(message_fts, rowid, content) VALUES ('delete', old.id, old.content);
+        INSERT INTO message_fts(rowid, content) VALUES (new.id, new.content);
+    END""",
+]
+
+POSTGRES_DDL = [
+    f"""ALTER TABLE message ADD COLUMN IF NOT EXISTS content_tsv tsvector
+        GENERATED ALWAYS AS (to_tsvector('{SEARCH_LANGUAGE}', content)) STORED""",
+    "CREATE INDEX IF NOT EXISTS ix_message_content_tsv ON message USING GIN (content_tsv)",
+]
+
+SQLITE_SEARCH = f"""
+    SELECT m.conversation_id, m.seq, m.role, m.created_at, c.name AS conversation_name,
+           snippet(message_fts, 0, '{_OPEN}', '{_CLOSE}', '…', {SNIPPET_TOKENS}) AS snippet,
+           bm25(message_fts) AS rank
+    FROM message_fts
+    JOIN message m ON m.id = message_fts.rowid
+    JOIN conversation c ON c.id = m.conversation_id
+    WHERE message_fts MATCH :query AND c.user_id = :user_id
+    ORDER BY rank
+    LIMIT :limit OFFSET :offset
+"""
+
+POSTGRES_SEARCH = f"""
+    SELECT m.conversation_id, m.seq, m.role, m.created_at, c.name AS conversation_name,
+           ts_headline('{SEARCH_LANGUAGE}', m.content, q,
+                       'StartSel={_OPEN}, StopSel={_CLOSE}, MaxWords=30, MinWords=10, MaxFragments=2') AS snippet,
+           ts_rank_cd(m.content_tsv, q) AS rank
+    FROM message m
+    JOIN conversation c ON c.id = m.conversation_id,
+         websearch_to_tsquery('{SEARCH_LANGUAGE}', :query) AS q
+    WHERE m.content_tsv @@ q AND c.user_id = :user_id
+    ORDER BY rank DESC
+    LIMIT :limit OFFSET :offset
+"""
+
+
+def _dialect() -> str:
+    return engine.dialect.name
+
+
+def ensure_search_index():
+    """Create the index and its triggers if missing; a new SQLite index is filled from existing messages."""
+    logger.info('\nDefined [ensure_search_index] is initiated ')
+    dialect = _dialect()
+    with engine.begin() as conn:
+        if dialect == "sqlite":
+            exists = conn.execute(text("SELECT 1 FROM sqlite_master WHERE name = 'message_fts'")).first()
+            for ddl in SQLITE_DDL:
+                conn.execute(text(ddl))
+            if not exists:
+                logger.info("[search] building message_fts from existing messages")
+                conn.execute(text("INSERT INTO message_fts(message_fts) VALUES ('rebuild')"))
+        elif dialect == "postgresql":
+            for ddl in POSTGRES_DDL:
+                conn.execute(text(ddl))
+        else:
+            logger.warning(f"[search] full-text search is not supported on {dialect}")
+
+
+def reindex():
+    """Rebuild the search index from the message table."""
+    logger.info('\nDefined [reindex] is initiated ')
+    ensure_search_index()
+    with engine.begin() as conn:
+        if _dialect() == "sqlite":
+            conn.execute(text("INSERT INTO message_fts(message_fts) VALUES ('rebuild')"))
+            conn.execute(text("INSERT INTO message_fts(message_fts) VALUES ('optimize')"))
+        elif _dialect() == "postgresql":
+            conn.execute(text("REINDEX INDEX ix_message_content_tsv"))
+
+
+def _fts5_query(query: str) -> str:
+    """Turn free text into an FTS5 query: every word must match, the last one as a prefix."""
+    terms = re.findall(r"\w+", query, flags=re.UNICODE)
+    if not terms:
+        return ""
+    quoted = ['"' + term + '"' for term in terms]
+    quoted[-1] += "*"
+    return " ".join(quoted)
+
+
+def _highlight(snippet: Optional[str]) -> str:
+    return html.escape(snippet or "").replace(_OPEN, "<mark>").replace(_CLOSE, "</mark>")
+
+
+async def search_messages(db: AsyncSession, user_id: int, query: str, limit: int = 20,
+                          offset: int = 0) -> Tuple[List[dict], bool]:
+    """
+    Best-ranked messages of `user_id` matching `query`. Returns (hits, has_more);
+    each hit carries conversation id/name, seq, role, ts and an HTML-safe
+    `snippet` with matches wrapped in <mark>.
+    """
+    logger.info('\nDefined [search_messages] is initiated ')
+    dialect = _dialect()
+    if dialect == "sqlite":
+        query, sql = _fts5_query(query), SQLITE_SEARCH
+    elif dialect == "postgresql":
+        query, sql = query.strip(), POSTGRES_SEARCH
+    else:
+        return [], False
+    if not query:
+        return [], False
+
+    params = {"query": query, "user_id": user_id, "limit": limit + 1, "offset": offset}
+    rows = (await db.exec(text(sql), params=params)).all()
+    hits = [
+        {
+            "conversation_id": row.conversation_id,
+            "conversation_name": row.conversation_name,
+            "seq": row.seq,
+            "role": row.role,
+            "ts": row.created_at.strftime("%Y-%m-%d %H:%M") if hasattr(row.created_at, "strftime") else str(row.created_at)[:16],
+            "snippet": _highlight(row.snippet),
+        }
+        for row in rows[:limit]
+    ]
+    return hits, len(rows) > limit
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    if sys.argv[1:] != ["reindex"]:
+        sys.exit("usage: python -m studio.services.search reindex")
+    reindex()
+    print("search index rebuilt")
@@ -0,0 +1,48 @@
+"""Regression cases for the URL sanitizer in tools/MARKDOWN/render.py."""
+import re
+
+import pytest
+
+from tools.MARKDOWN.render import SAFE_URL_SCHEMES, _scheme, is_safe_url, render_markdown
+
+UNSAFE = [
+    "[x](javascript:alert(1))",
+    "[x](JaVaScRiPt:alert(1))",
+    "[x](&#106;avascript:alert(1))",
+    "[x](&#x6A;avascript:alert(1))",
+    "[x](&#X6a;AVASCRIPT:alert(1))",
+    "[x](java&#x09;script:alert(1))",
+    "[x](java&#9;script:alert(1))",
+    "[x](&#0000106;avascript:alert(1))",
+    "[x](jav&#x0A;ascript:alert(1))",
+    "[x](data:text/html;base64,PHNjcmlwdD4=)",
+    "[x](vbscript:msgbox(1))",
+    "![a](&#x6A;avascript:alert(1))",
+    "![a](javascript:alert(1))",
+    "[x][r]\n\n[r]: &#106;avascript:alert(1)",
+    "<a href=\"javascript:alert(1)\">x</a>",
+    "<script>alert(1)</script>",
+]
+
+
+@pytest.mark.parametrize("source", UNSAFE)
+def test_unsafe_urls_are_stripped(source):
+    html = render_markdown(source)
+    assert "<script" not in html.lower()
+    for url in re.findall(r'<(?:a|img)\b[^>]*?\s(?:href|src)="([^"]*)"', html):
+        # What the browser sees once it has decoded the attribute.
+        assert _scheme(url) in (None, *SAFE_URL_SCHEMES)
+
+
+@pytest.mark.parametrize("url", ["&#106;avascript:x", "JAVASCRIPT:x", "java\tscript:x", " javascript:x"])
+def test_is_safe_url_decodes_before_checking(url):
+    assert not is_safe_url(url)
+
+
+@pytest.mark.parametrize("source, expected", [
+    ("[x](https://example.com/a?b=1&c=2)", 'href="https://example.com/a?b=1&amp;c=2"'),
+    ("[x](/docs/page)", 'href="/docs/page"'),
+    ("![a](https://example.com/i.png)", 'src="https://example.com/i.png"'),
+])
+def test_safe_urls_are_kept(source, expected):
+    assert expected in render_markdown(source)
@@ -1,9 +1,26 @@
+import io
+
 from fastapi import APIRouter
-from .generator import generate_docx
+from fastapi.responses import StreamingResponse
+
+from .generator import DOCX_MEDIA_TYPE, docx_filename, render_docx_async
 
 router = APIRouter()
 
+
+async def docx_response(content: str, title: str = "AI Output") -> StreamingResponse:
+    """Render `content` to DOCX in memory and stream it back as a download."""
+    data = await render_docx_async(content, title)
+    return StreamingResponse(
+        io.BytesIO(data),
+        media_type=DOCX_MEDIA_TYPE,
+        headers={
+            "Content-Disposition": f'attachment; filename="{docx_filename(title)}"',
+            "Content-Length": str(len(data)),
+        },
+    )
+
+
 @router.post("/doc/generate")
-def generate_doc(text: str):
-    file_path = generate_docx(text)
-    return {"file": str(file_path)}
\ No newline at end of file
+async def generate_doc(text: str, title: str = "AI Output"):
+    return await docx_response(text, title)
@@ -1,24 +1,192 @@
-from docx import Document
+"""
+DOCX generation for AI output.
+
+Documents are rendered into memory (no files under generated/), with the
+Markdown structure of the text (headings, bullet/numbered lists, quotes,
+fenced code, **bold**/*italic*/`code` runs) mapped onto real Word styles.
+Each base template is built and styled once per process and cached as
+bytes. Large documents render in a bounded process pool, small ones in a
+worker thread, so the event loop never does the rendering itself.
+"""
+import asyncio
+import io
+import multiprocessing
+import os
+import re
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
 from pathlib import Path
-import uuid
+from typing import Optional
+
+from docx import Document
+from docx.enum.style import WD_STYLE_TYPE
+from docx.shared import Pt, RGBColor
+
+DOCX_MEDIA_TYPE = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+TEMPLATE_DIR = Path(__file__).parent / "templates"       # optional <name>.docx base templates
+DOCGEN_WORKERS = int(os.getenv("DOCGEN_WORKERS", str(min(4, os.cpu_count() or 1))))
+DOCGEN_PROCESS_THRESHOLD = int(os.getenv("DOCGEN_PROCESS_THRESHOLD", "20000"))   # characters
+DOCGEN_MAX_PENDING = int(os.getenv("DOCGEN_MAX_PENDING", str(DOCGEN_WORKERS * 4)))
+
+CODE_STYLE = "Code"
+CODE_FONT = "Consolas"
+
+_HEADING = re.compile(r"^(#{1,6})\s+(.*)$")
+_BULLET = re.compile(r"^(\s*)[-*+]\s+(.*)$")
+_NUMBERED = re.compile(r"^(\s*)\d+[.)]\s+(.*)$")
+_QUOTE = re.compile(r"^>\s?(.*)$")
+_FENCE = re.compile(r"^\s*```")
+_INLINE = re.compile(r"(\*\*[^*]+\*\*|`[^`]+`|\*[^*\s][^*]*\*)")   # underscores left alone: snake_case
+
+
+# ---------- Templates ----------
+def _style_document(doc):
+    styles = doc.styles
+    normal = styles["Normal"]
+    normal.font.name = "Calibri"
+    normal.font.size = Pt(11)
+    if CODE_STYLE not in [s.name for s in styles]:
+        code = styles.add_style(CODE_STYLE, WD_STYLE_TYPE.PARAGRAPH)
+        # Custom templates may not define "No Spacing"; fall back to the default paragraph style.
+        code.base_style = styles["No Spacing"] if "No Spacing" in styles else normal
+        code.font.name = CODE_FONT
+        code.font.size = Pt(9.5)
+        code.font.color.rgb = RGBColor(0x33, 0x33, 0x33)
+        code.paragraph_format.left_indent = Pt(12)
+
+
+@lru_cache(maxsize=8)
+def _template_bytes(template: str) -> bytes:
+    """The styled base document for `template`, serialized once per process."""
+    path = TEMPLATE_DIR / f"{template}.docx"
+    doc = Document(str(path)) if path.exists() else Document()
+    _style_document(doc)
+    buffer = io.BytesIO()
+    doc.save(buffer)
+    return buffer.getvalue()
+
+
+# ---------- Markdown -> DOCX ----------
+def _add_runs(paragraph, text: str):
+    for part in _INLINE.split(text):
+        if not part:
+            continue
+        if part.startswith("**") and len(part) > 4:
+            paragraph.add_run(part[2:-2]).bold = True
+        elif part.startswith("`") and len(part) > 2:
+            paragraph.add_run(part[1:-1]).font.name = CODE_FONT
+        elif part[0] == "*" and part[-1] == "*" and len(part) > 2:
+            paragraph.add_run(part[1:-1]).italic = True
+        else:
+            paragraph.add_run(part)
+
+
+def _list_style(base: str, indent: str) -> str:
+    level = min(len(indent.replace("\t", "  ")) // 2, 2)
+    return base if level == 0 else f"{base} {level + 1}"
+
+
+def markdown_to_docx(doc, text: str):
+    """Append `text` to `doc`, turning Markdown block structure into Word styles."""
+    code_lines = None
+    paragraph_lines = []
+
+    def flush_paragraph():
+        if paragraph_lines:
+            _add_runs(doc.add_paragraph(), " ".join(line.strip() for line in paragraph_lines))
+            paragraph_lines.clear()
+
+    for line in text.splitlines():
+        if _FENCE.match(line):
+            if code_lines is None:
+                flush_paragraph()
+                code_lines = []
+            else:
+                doc.add_paragraph("\n".join(code_lines), style=CODE_STYLE)
+                code_lines = None
+            continue
+        if code_lines is not None:
+            code_lines.append(line)
+            continue
+        if not line.strip():
+            flush_paragraph()
+            continue
+
+        heading, bullet, numbered, quote = _HEADING.match(line), _BULLET.match(line), _NUMBERED.match(line), _QUOTE.match(line)
+        if heading:
+            flush_paragraph()
+            doc.add_heading(heading.group(2).strip(), level=len(heading.group(1)))
+        elif bullet:
+            flush_paragraph()
+            _add_runs(doc.add_paragraph(style=_list_style("List Bullet", bullet.group(1))), bullet.group(2))
+        elif numbered:
+            flush_paragraph()
+            _add_runs(doc.add_paragraph(style=_list_style("List Number", numbered.group(1))), numbered.group(2))
+        elif quote:
+            flush_paragraph()
+            _add_runs(doc.add_paragraph(style="Quote"), quote.group(1))
+        else:
+            paragraph_lines.append(line)
+
+    flush_paragraph()
+    if code_lines is not None:           # unterminated fence: keep the code anyway
+        doc.add_paragraph("\n".join(code_lines), style=CODE_STYLE)
+
+
+def render_docx(content: str, title: Optional[str] = "AI Output", template: str = "default") -> bytes:
+    """Render Markdown-ish `content` into DOCX bytes (runs in a worker thread or process)."""
+    doc = Document(io.BytesIO(_template_bytes(template)))
+    if title:
+        doc.add_heading(title, level=0)
+    markdown_to_docx(doc, content)
+    buffer = io.BytesIO()
+    doc.save(buffer)
+    return buffer.getvalue()
+
+
+def docx_filename(title: Optional[str]) -> str:
+    slug = re.sub(r"[^A-Za-z0-9]+", "_", title or "").strip("_")[:50]
+    return f"{slug or 'document'}.docx"
+
+
+# ---------- Worker pool ----------
+_pool: Optional[ProcessPoolExecutor] = None
+_pending: Optional[asyncio.Semaphore] = None
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        # Spawned, not forked: the server is already running threads (event loop, thread pool, tokenizers).
+        _pool = ProcessPoolExecutor(max_workers=DOCGEN_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return _pool
+
+
+async def render_docx_async(content: str, title: Optional[str] = "AI Output", template: str = "default") -> bytes:
+    """Render off the event loop; at most DOCGEN_MAX_PENDING renders are in flight at once."""
+    global _pending
+    if _pending is None:
+        _pending = asyncio.Semaphore(DOCGEN_MAX_PENDING)
+    async with _pending:
+        if len(content) < DOCGEN_PROCESS_THRESHOLD:
+            return await asyncio.to_thread(render_docx, content, title, template)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_get_pool(), render_docx, content, title, template)
 
-def generate_docx(content: str, title: str = "AI Output", filename: str = "DOC-GEN") -> str:
-    """
-    Generate a .docx document with a given content and title.
-    Returns the saved file path.
-    """
-    doc = Document()
-    doc.add_heading(title, level=1)
-    doc.add_paragraph(content)
 
-    file_id = filename or f"{title.replace(' ', '_')}_{uuid.uuid4().hex[:8]}.docx"
-    output_path = Path("generated") / file_id
-    output_path.parent.mkdir(exist_ok=True)
-    doc.save(str(output_path))
+def shutdown_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
 
-    return str(output_path)
 
 # Optional CLI usage
 if __name__ == "__main__":
-    path = generate_docx("This is a test document generated by the AI Studio.", "Sample Title")
-    print(f"Document saved at: {path}")
+    out = Path(sys.argv[1] if len(sys.argv) > 1 else "sample.docx")
+    out.write_bytes(render_docx(
+        "# Heading\n\nThis is a **test** document generated by the *AI Studio*.\n\n- one\n- two\n\n```python\nprint('hi')\n```",
+        "Sample Title",
+    ))
+    print(f"Document saved at: {out}")
@@ -0,0 +1,115 @@
+"""
+Markdown -> sanitized HTML for AI responses.
+
+One configured Markdown instance is reused for every render (guarded by a
+lock, since Python-Markdown instances are stateful). Raw HTML in the source
+is escaped rather than passed through, and links/images whose URL scheme is
+not on the allow-list are stripped; the scheme is checked the way a browser
+reads the attribute (character references decoded, control and whitespace
+characters dropped). Rendered HTML is kept in an LRU keyed
+by the sha256 of the source, so repeated content is rendered once.
+"""
+import hashlib
+import os
+import re
+import threading
+from html import unescape
+import logging
+from collections import OrderedDict
+from typing import Optional
+
+import markdown
+from markdown.treeprocessors import Treeprocessor
+
+logger = logging.getLogger(__name__)
+
+MARKDOWN_CACHE_SIZE = int(os.getenv("MARKDOWN_CACHE_SIZE", "2048"))
+MARKDOWN_EXTENSIONS = ["fenced_code", "tables", "sane_lists"]
+SAFE_URL_SCHEMES = {"http", "https", "mailto"}
+# Roles whose messages are stored with pre-rendered HTML.
+RENDERED_ROLES = {"assistant"}
+
+_SCHEME = re.compile(r"^([a-z][a-z0-9+.\-]*):")
+_IGNORED_URL_CHARS = re.compile(r"[\x00-\x20\x7f-\x9f\s]+")
+
+
+def _scheme(url: str) -> Optional[str]:
+    # Decode "&#106;avascript:" / "java&#x09;script:" before looking at the scheme.
+    match = _SCHEME.match(_IGNORED_URL_CHARS.sub("", unescape(url)).lower())
+    return match.group(1) if match else None
+
+
+def is_safe_url(url: str) -> bool:
+    """Relative URLs and allow-listed schemes only (no javascript:, data:, vbscript:, ...)."""
+    scheme = _scheme(url)
+    return scheme is None or scheme in SAFE_URL_SCHEMES
+
+
+class _UrlSanitizer(Treeprocessor):
+    def run(self, root):
+        for element in root.iter():
+            if element.tag == "a":
+                href = element.get("href")
+                if href is None:
+                    continue
+                if not is_safe_url(href):
+                    del element.attrib["href"]
+                elif _scheme(href):
+                    element.set("rel", "nofollow noopener noreferrer")
+            elif element.tag == "img" and not is_safe_url(element.get("src", "")):
+                element.attrib.pop("src", None)
+
+
+class MarkdownRenderer:
+    def __init__(self, max_entries: int = MARKDOWN_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._md = markdown.Markdown(extensions=MARKDOWN_EXTENSIONS, output_format="html")
+        # Escape raw HTML instead of passing it through.
+        self._md.preprocessors.deregister("html_block")
+        self._md.inlinePatterns.deregister("html")
+        # After the inline processor, so links and images exist as elements.
+        self._md.treeprocessors.register(_UrlSanitizer(self._md), "url_sanitizer", 1)
+        self._lock = threading.Lock()
+        self._cache: "OrderedDict[str, str]" = OrderedDict()  # sha256(source) -> html
+        self.hits = 0
+        self.misses = 0
+
+    def render(self, text: Optional[str]) -> str:
+        """Sanitized HTML for `text`; safe to call from any thread."""
+        if not text:
+            return ""
+        key = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        with self._lock:
+            html = self._cache.get(key)
+            if html is not None:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return html
+            self.misses += 1
+            html = self._md.reset().convert(text)
+            self._cache[key] = html
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+            return html
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._cache),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+markdown_renderer = MarkdownRenderer()
+
+
+def render_markdown(text: Optional[str]) -> str:
+    return markdown_renderer.render(text)
+
+
+def render_message_html(role: str, content: str) -> Optional[str]:
+    """HTML stored alongside a message, or None for roles shown as plain text."""
+    return render_markdown(content) if role in RENDERED_ROLES else None
+
@@ -1,47 +1,310 @@
 import os
-from typing import List
+import json
+import time
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import FIRST_COMPLETED, Executor, ProcessPoolExecutor, wait
+from functools import lru_cache
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain.embeddings import HuggingFaceEmbeddings
 from langchain.vectorstores import Chroma
-# from langchain.document_loaders import TextLoader, PDFPlumberLoader, Docx2txtLoader, UnstructuredMarkdownLoader
-from langchain_community.document_loaders import (
-    TextLoader,
-    PDFPlumberLoader,
-    Docx2txtLoader,
-    UnstructuredMarkdownLoader,
-)
+
+from .loaders import Record, file_hash, parse_file, supported
+
+logger = logging.getLogger(__name__)
 
 INGEST_DIR = "rag/documents"
 CHROMA_DB_DIR = "rag/chroma_db"
+# file -> content hash + chunk ids stored in Chroma; drives incremental ingestion
+MANIFEST_PATH = os.path.join(CHROMA_DB_DIR, "manifest.json")
+MANIFEST_VERSION = 1
+
+EMBEDDING_MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+CHUNK_SIZE = 500
+CHUNK_OVERLAP = 100
+
+RAG_PARSE_WORKERS = int(os.getenv("RAG_PARSE_WORKERS", str(os.cpu_count() or 1)))
+RAG_PARSE_WINDOW = int(os.getenv("RAG_PARSE_WINDOW", str(RAG_PARSE_WORKERS * 2)))   # parsed files held at once
+RAG_BATCH_SIZE = int(os.getenv("RAG_BATCH_SIZE", "256"))      # chunks per embed call + vector store write
+RAG_ENCODE_BATCH = int(os.getenv("RAG_ENCODE_BATCH", "64"))   # sentence-transformers batch inside one embed call
+
+_ingest_lock = threading.Lock()
+
+
+@lru_cache(maxsize=1)
+def get_embedding_model() -> HuggingFaceEmbeddings:
+    # Pick embedding model (lightweight but good). Loaded on first ingest; encoding runs on
+    # torch's intra-op thread pool, i.e. on every core.
+    return HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL_NAME, encode_kwargs={"batch_size": RAG_ENCODE_BATCH})
+
+
+def _settings() -> dict:
+    # Anything that changes the vectors; a mismatch forces a full rebuild.
+    return {"embedding_model": EMBEDDING_MODEL_NAME, "chunk_size": CHUNK_SIZE, "chunk_overlap": CHUNK_OVERLAP}
+
+
+def _document_files() -> List[str]:
+    return sorted(
+        fname for fname in os.listdir(INGEST_DIR)
+        if supported(fname) and os.path.isfile(os.path.join(INGEST_DIR, fname))
+    )
 
-# Pick embedding model (lightweight but good)
-embedding_model = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
 
-def load_documents() -> List[str]:
+def load_documents() -> List[Record]:
     docs = []
-    for fname in os.listdir(INGEST_DIR):
-        fpath = os.path.join(INGEST_DIR, fname)
-        if fname.endswith(".txt"):
-            docs.extend(TextLoader(fpath).load())
-        elif fname.endswith(".md"):
-            docs.extend(UnstructuredMarkdownLoader(fpath).load())
-        elif fname.endswith(".pdf"):
-            docs.extend(PDFPlumberLoader(fpath).load())
-        elif fname.endswith(".docx"):
-            docs.extend(Docx2txtLoader(fpath).load())
+    for fname in _document_files():
+        docs.extend(parse_file(os.path.join(INGEST_DIR, fname)))
     return docs
 
-def ingest():
-    print("🔍 Loading and chunking documents...")
-    raw_docs = load_documents()
-    splitter = RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=100)
-    chunks = splitter.split_documents(raw_docs)
-
-    print(f"✅ Total Chunks: {len(chunks)}")
-    print("📦 Creating Chroma DB...")
-    vectorstore = Chroma.from_documents(chunks, embedding=embedding_model, persist_directory=CHROMA_DB_DIR)
-    vectorstore.persist()
-    print("🚀 Ingestion completed and saved to DB.")
+
+# ---------- Manifest ----------
+def load_manifest() -> Optional[dict]:
+    """The manifest of the current Chroma DB, or None if missing or built with other settings."""
+    try:
+        with open(MANIFEST_PATH, encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if manifest.get("version") != MANIFEST_VERSION or manifest.get("settings") != _settings():
+        return None
+    return manifest
+
+
+def save_manifest(files: Dict[str, dict]):
+    os.makedirs(os.path.dirname(MANIFEST_PATH), exist_ok=True)
+    tmp_path = MANIFEST_PATH + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"version": MANIFEST_VERSION, "settings": _settings(), "files": files}, f, indent=1)
+    os.replace(tmp_path, MANIFEST_PATH)
+
+
+def chunk_ids(fname: str, digest: str, count: int) -> List[str]:
+    # Deterministic, so re-adding a file after an interrupted run upserts instead of duplicating.
+    return [f"{fname}:{digest[:16]}:{i}" for i in range(count)]
+
+
+def _changed(entry: Optional[dict], fpath: str) -> Optional[str]:
+    """New content hash if the file differs from its manifest entry, else None."""
+    stat = os.stat(fpath)
+    if entry and entry.get("size") == stat.st_size and entry.get("mtime") == stat.st_mtime:
+        return None
+    digest = file_hash(fpath)
+    if entry and entry.get("sha256") == digest:
+        entry["size"], entry["mtime"] = stat.st_size, stat.st_mtime   # touched, not edited
+        return None
+    return digest
+
+
+# ---------- Pipeline stages ----------
+def _parse_stage(fnames: List[str], pool: Optional[Executor]) -> Iterator[Tuple[str, Optional[List[Record]]]]:
+    """
+    (file, records) as files finish parsing; records is None if the file could
+    not be parsed. At most RAG_PARSE_WINDOW parsed files are held at once.
+    """
+    if pool is None:
+        for fname in fnames:
+            try:
+                yield fname, parse_file(os.path.join(INGEST_DIR, fname))
+            except Exception as e:
+                logger.warning("[rag] could not parse %s: %s", fname, e)
+                yield fname, None
+        return
+
+    pending = iter(fnames)
+    running = {}
+
+    def submit_next():
+        fname = next(pending, None)
+        if fname is not None:
+            running[pool.submit(parse_file, os.path.join(INGEST_DIR, fname))] = fname
+
+    for _ in range(max(1, RAG_PARSE_WINDOW)):
+        submit_next()
+    while running:
+        done, _ = wait(running, return_when=FIRST_COMPLETED)
+        for future in done:
+            fname = running.pop(future)
+            submit_next()
+            try:
+                yield fname, future.result()
+            except Exception as e:
+                logger.warning("[rag] could not parse %s: %s", fname, e)
+                yield fname, None
+
+
+class _BatchWriter:
+    """
+    Embeds and upserts chunks RAG_BATCH_SIZE at a time, whatever file they come
+    from, and reports files once all of their chunks are stored.
+    """
+
+    def __init__(self, collection, on_files_stored: Callable[[List[str]], None], batch_size: int = RAG_BATCH_SIZE):
+        self._collection = collection
+        self._on_files_stored = on_files_stored
+        self.batch_size = batch_size
+        self._ids: List[str] = []
+        self._texts: List[str] = []
+        self._metadatas: List[dict] = []
+        self._owners: List[str] = []
+        self._remaining: Dict[str, int] = {}
+        self.chunks = 0
+        self.embed_s = 0.0
+        self.write_s = 0.0
+
+    def add_file(self, fname: str, ids: List[str], texts: List[str], metadatas: List[dict]):
+        if not ids:
+            self._on_files_stored([fname])
+            return
+        self._remaining[fname] = len(ids)
+        self._ids += ids
+        self._texts += texts
+        self._metadatas += metadatas
+        self._owners += [fname] * len(ids)
+        while len(self._ids) >= self.batch_size:
+            self._flush()
+
+    def close(self):
+        while self._ids:
+            self._flush()
+
+    def _flush(self):
+        n = self.batch_size
+        ids, self._ids = self._ids[:n], self._ids[n:]
+        texts, self._texts = self._texts[:n], self._texts[n:]
+        metadatas, self._metadatas = self._metadatas[:n], self._metadatas[n:]
+        owners, self._owners = self._owners[:n], self._owners[n:]
+
+        started = time.perf_counter()
+        embeddings = get_embedding_model().embed_documents(texts)
+        written = time.perf_counter()
+        self._collection.upsert(ids=ids, embeddings=embeddings, documents=texts, metadatas=metadatas)
+        self.embed_s += written - started
+        self.write_s += time.perf_counter() - written
+        self.chunks += len(ids)
+
+        stored = []
+        for owner in owners:
+            self._remaining[owner] -= 1
+            if not self._remaining[owner]:
+                del self._remaining[owner]
+                stored.append(owner)
+        if stored:
+            self._on_files_stored(stored)
+
+
+# ---------- Ingestion ----------
+def _clear(vectorstore: Chroma, page: int = 5000):
+    # Empties the collection in place; the retriever keeps a handle on it, so it is not dropped.
+    while True:
+        ids = vectorstore.get(limit=page, include=[])["ids"]
+        if not ids:
+            return
+        vectorstore.delete(ids=ids)
+
+
+def ingest(full: bool = False) -> dict:
+    """
+    Bring the Chroma DB in line with INGEST_DIR: only new or changed files are
+    parsed (in a process pool), chunked and embedded in batches, and vectors of
+    changed or deleted files are removed. `full` (or a missing/outdated
+    manifest) rebuilds the collection from scratch.
+    """
+    with _ingest_lock:
+        return _ingest(full)
+
+
+def _ingest(full: bool) -> dict:
+    started = time.perf_counter()
+    manifest = None if full else load_manifest()
+    vectorstore = Chroma(persist_directory=CHROMA_DB_DIR, embedding_function=get_embedding_model())
+    if manifest is None:
+        print("📦 No usable manifest, rebuilding Chroma DB...")
+        # Vectors from earlier ingests have unknown ids; start over rather than duplicate them.
+        _clear(vectorstore)
+        manifest = {"files": {}}
+    files: Dict[str, dict] = manifest["files"]
+    report = {"added": [], "updated": [], "removed": [], "failed": [], "unchanged": 0,
+              "chunks_added": 0, "chunks_removed": 0}
+
+    # Old vectors of deleted and changed files go first, in one call.
+    print("🔍 Checking documents for changes...")
+    present = _document_files()
+    stale_ids: List[str] = []
+    for fname in set(files) - set(present):
+        stale_ids += files.pop(fname)["chunk_ids"]
+        report["removed"].append(fname)
+    digests: Dict[str, str] = {}
+    for fname in present:
+        digest = _changed(files.get(fname), os.path.join(INGEST_DIR, fname))
+        if digest is None:
+            report["unchanged"] += 1
+        else:
+            digests[fname] = digest
+            stale_ids += files[fname]["chunk_ids"] if fname in files else []
+    for i in range(0, len(stale_ids), 5000):
+        vectorstore.delete(ids=stale_ids[i:i + 5000])
+    report["chunks_removed"] = len(stale_ids)
+    save_manifest(files)
+
+    # Entries for changed files are committed once all of their chunks are stored,
+    # so an interrupted run only redoes files that were not finished.
+    new_entries: Dict[str, dict] = {}
+
+    def on_files_stored(fnames: List[str]):
+        for fname in fnames:
+            entry = new_entries.pop(fname)
+            report["updated" if fname in files else "added"].append(fname)
+            report["chunks_added"] += len(entry["chunk_ids"])
+            files[fname] = entry
+        save_manifest(files)
+
+    splitter = RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+    # Vectors are computed here in batches, so write them straight to the Chroma collection.
+    writer = _BatchWriter(vectorstore._collection, on_files_stored)
+    todo = list(digests)
+    # A pool only pays for itself with more than one file to parse. Workers are spawned, not
+    # forked: this runs inside the server, after torch / tokenizers have started their threads.
+    pool = ProcessPoolExecutor(max_workers=RAG_PARSE_WORKERS, mp_context=multiprocessing.get_context("spawn")) \
+        if len(todo) > 1 and RAG_PARSE_WORKERS > 1 else None
+    try:
+        for fname, records in _parse_stage(todo, pool):
+            if records is None:
+                report["failed"].append(fname)
+                files.pop(fname, None)   # its old vectors are gone; retried on the next run
+                continue
+            digest = digests[fname]
+            chunks = splitter.create_documents([text for text, _ in records], [meta for _, meta in records])
+            ids = chunk_ids(fname, digest, len(chunks))
+            for chunk in chunks:
+                chunk.metadata["source_file"] = fname
+                chunk.metadata["source_sha256"] = digest
+            stat = os.stat(os.path.join(INGEST_DIR, fname))
+            new_entries[fname] = {"sha256": digest, "size": stat.st_size, "mtime": stat.st_mtime, "chunk_ids": ids}
+            writer.add_file(fname, ids, [c.page_content for c in chunks], [c.metadata for c in chunks])
+        writer.close()
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+
+    save_manifest(files)
+    if hasattr(vectorstore, "persist"):
+        vectorstore.persist()   # no-op / absent on Chroma >= 0.4, which persists on write
+
+    elapsed = time.perf_counter() - started
+    processed = len(report["added"]) + len(report["updated"])
+    report["timing"] = {
+        "total_s": round(elapsed, 3),
+        "embed_s": round(writer.embed_s, 3),
+        "write_s": round(writer.write_s, 3),
+        "docs_per_s": round(processed / elapsed, 2) if elapsed else None,
+        "chunks_per_s": round(writer.chunks / elapsed, 2) if elapsed else None,
+    }
+    print(f"🚀 Ingestion completed: {len(report['added'])} added, {len(report['updated'])} updated, "
+          f"{len(report['removed'])} removed, {len(report['failed'])} failed, {report['unchanged']} unchanged "
+          f"({writer.chunks} chunks in {elapsed:.1f}s).")
+    return report
 
 # if __name__ == "__main__":
 #     ingest()
@@ -0,0 +1,47 @@
+"""
+Document parsing for RAG ingestion.
+
+Kept free of embedding / vector store imports: `parse_file` runs in spawned
+worker processes, which import this module fresh and only need the loader of
+the file at hand, imported on first use.
+"""
+import os
+import hashlib
+import importlib
+from typing import List, Tuple
+
+# extension -> (langchain_community.document_loaders submodule, loader class)
+LOADERS = {
+    ".txt": ("text", "TextLoader"),
+    ".md": ("markdown", "UnstructuredMarkdownLoader"),
+    ".pdf": ("pdf", "PDFPlumberLoader"),
+    ".docx": ("word_document", "Docx2txtLoader"),
+}
+
+# (page text, metadata) per page/section the loader returns
+Record = Tuple[str, dict]
+
+
+def supported(fname: str) -> bool:
+    return os.path.splitext(fname)[1] in LOADERS
+
+
+def file_hash(fpath: str) -> str:
+    digest = hashlib.sha256()
+    with open(fpath, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _clean_metadata(metadata: dict) -> dict:
+    # Chroma only stores str/int/float/bool values.
+    return {k: v for k, v in metadata.items() if isinstance(v, (str, int, float, bool))}
+
+
+def parse_file(fpath: str) -> List[Record]:
+    """Text and metadata of every page of `fpath`; plain tuples so results pickle cheaply."""
+    module, name = LOADERS[os.path.splitext(fpath)[1]]
+    loader = getattr(importlib.import_module(f"langchain_community.document_loaders.{module}"), name)
+    docs = loader(fpath).load()
+    return [(doc.page_content, _clean_metadata(doc.metadata)) for doc in docs]
@@ -1,3 +1,5 @@
+from typing import Optional
+
 from fastapi import APIRouter
 
 from .retriever import retrieve_documents
@@ -8,9 +10,10 @@ from .vector_store import get_vector_store
 router = APIRouter()
 
 @router.post("/rag/ingest")
-def ingest_doc(path: str):
-    ingest()
-    return {"status": "ingested"}
+def ingest_doc(path: Optional[str] = None, full: bool = False):
+    # Incremental: only new/changed files are embedded; `full=true` rebuilds the DB.
+    report = ingest(full=full)
+    return {"status": "ingested", **report}
 
 @router.get("/rag/retrieve")
 def retrieve(query: str):